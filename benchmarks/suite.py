@@ -0,0 +1,409 @@
+"""
+Benchmark suite of the plugin's overhead on synthetic projects.
+
+Generates projects of N tests (1k, 10k and 100k by default) in a temporary
+directory, with a share of tests marked @pytest.mark.idempotent that call a chain
+of nested @idempotent functions, while the other tests call plain functions. Each
+project is run in a subprocess with and without the plugin, and the suite reports:
+
+- the collection time, and the run time of the collected tests,
+- the hook overhead per test: the difference in run time per collected test,
+- the run_twice overhead per call, for each nesting depth, with and without the
+  idempotency check,
+- the overhead per checked call of isolation="fork", which forks a child process
+  for every second run,
+- the peak RSS of each pytest process.
+
+pytest runs with its default plugins, including the cache provider, so the
+results include the cost of the plugin's cache reads and writes.
+
+Results are written as JSON, and can be compared to the results of another commit:
+
+    python -m benchmarks.suite [--sizes 1000 10000] [--output results.json]
+    python -m benchmarks.suite --compare baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import textwrap
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+TESTS_PER_MODULE = 1000
+PARAMS_PER_TEST = 10
+PYTEST_ARGS = ("-q", "-p", "no:randomly", "-W", "ignore")
+# Compared with --compare, where a higher value is a regression.
+METRICS = (
+    "collection_s",
+    "run_s",
+    "hook_overhead_us",
+    "max_rss_mib",
+)
+
+# Runs pytest in this process, and writes its timings and peak RSS to a JSON file.
+RUNNER = """
+import json
+import resource
+import sys
+from time import perf_counter
+
+import pytest
+
+
+class Timer:
+    def __init__(self):
+        self.start = perf_counter()
+        self.collected = self.end_collection = 0
+
+    def pytest_collection_finish(self, session):
+        self.collected = len(session.items)
+        self.end_collection = perf_counter()
+
+
+timer = Timer()
+exit_code = pytest.main(sys.argv[2:], plugins=[timer])
+end = perf_counter()
+with open(sys.argv[1], "w") as f:
+    json.dump(
+        {
+            "exit_code": int(exit_code),
+            "collected": timer.collected,
+            "collection_s": timer.end_collection - timer.start,
+            "run_s": end - timer.end_collection,
+            "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+        f,
+    )
+"""
+
+SERVICE_FUNCTION = """
+def plain_{function}(store, key):
+    store[key] = store.get(key, 0) + 1
+
+
+@idempotent
+def upsert_{function}_0(store, key):
+    store[key] = 1
+"""
+
+NESTED_FUNCTION = """
+@idempotent
+def upsert_{function}_{depth}(store, key):
+    upsert_{function}_{previous}(store, key)
+"""
+
+TEST_FUNCTION = """
+{marker}@pytest.mark.parametrize("key", range({params}))
+def test_{test}(key):
+    store = {{}}
+    service.{function}(store, key)
+    assert store[key] == 1
+"""
+
+OVERHEAD_TEST = """
+import json
+import os
+import timeit
+
+import pytest
+
+from service import plain_0, upsert_0_{top}
+
+
+@pytest.mark.idempotent
+def test_overhead(request):
+    number = {number}
+    plain_ns = min(timeit.repeat(lambda: plain_0({{}}, 0), number=number, repeat=5))
+    upsert_ns = min(
+        timeit.repeat(lambda: upsert_0_{top}({{}}, 0), number=number, repeat=5)
+    )
+    with open(os.environ["BENCHMARK_OUTPUT"], "a") as f:
+        f.write(
+            json.dumps(
+                {{
+                    "variant": request.node.callspec.id,
+                    "plain_ns": plain_ns * 1e9 / number,
+                    "upsert_ns": upsert_ns * 1e9 / number,
+                }}
+            )
+            + "\\n"
+        )
+"""
+
+FORK_TEST = """
+import json
+import os
+import timeit
+
+import pytest
+
+from pytest_idempotent import idempotent
+from service import upsert_0_0
+
+
+@idempotent(isolation="fork")
+def forked_upsert(store, key):
+    store[key] = 1
+
+
+@pytest.mark.idempotent
+def test_fork_overhead(request):
+    number = {number}
+    upsert_ns = min(timeit.repeat(lambda: upsert_0_0({{}}, 0), number=number, repeat=3))
+    if request.node.callspec.id != "check_idempotency":
+        return
+    forked_ns = min(
+        timeit.repeat(lambda: forked_upsert({{}}, 0), number=number, repeat=3)
+    )
+    with open(os.environ["BENCHMARK_OUTPUT"], "w") as f:
+        json.dump(
+            {{
+                "upsert_ns": upsert_ns * 1e9 / number,
+                "forked_ns": forked_ns * 1e9 / number,
+            }},
+            f,
+        )
+"""
+
+
+def generate_project(
+    project_dir: Path, num_tests: int, marked_share: float, functions: int, depth: int
+) -> None:
+    """
+    Generates a project of num_tests tests, with a service module of `functions`
+    chains of `depth` nested @idempotent functions. Marked tests are spread evenly.
+    """
+    tests_dir = project_dir / "tests"
+    tests_dir.mkdir(parents=True)
+    (project_dir / "pytest.ini").write_text("[pytest]\npythonpath = .\n")
+    service = ["from pytest_idempotent import idempotent\n"]
+    for function in range(functions):
+        service.append(SERVICE_FUNCTION.format(function=function))
+        service.extend(
+            NESTED_FUNCTION.format(function=function, depth=level, previous=level - 1)
+            for level in range(1, depth)
+        )
+    (project_dir / "service.py").write_text("\n".join(service))
+
+    num_functions = num_tests // PARAMS_PER_TEST
+    for module, first in enumerate(range(0, num_functions, TESTS_PER_MODULE)):
+        lines = ["import pytest\n\nimport service\n"]
+        for test in range(first, min(first + TESTS_PER_MODULE, num_functions)):
+            is_marked = int((test + 1) * marked_share) > int(test * marked_share)
+            function = test % functions
+            lines.append(
+                TEST_FUNCTION.format(
+                    marker="@pytest.mark.idempotent\n" if is_marked else "",
+                    params=PARAMS_PER_TEST,
+                    test=test,
+                    function=(
+                        f"upsert_{function}_{depth - 1}"
+                        if is_marked
+                        else f"plain_{function}"
+                    ),
+                )
+            )
+        (tests_dir / f"test_module_{module}.py").write_text("\n".join(lines))
+
+
+def run_pytest(
+    project_dir: Path, *args: str, env: dict[str, str] | None = None
+) -> dict[str, Any]:
+    """Runs pytest on the project in a subprocess, and returns its measurements."""
+    output = project_dir / "runner.json"
+    env = {**os.environ, **(env or {}), "PYTHONPATH": str(REPO_ROOT)}
+    subprocess.run(  # noqa: S603
+        [sys.executable, "-c", RUNNER, str(output), *PYTEST_ARGS, *args],
+        check=False,
+        cwd=project_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    result: dict[str, Any] = json.loads(output.read_text())
+    if result["exit_code"] != pytest.ExitCode.OK:
+        raise RuntimeError(f"pytest failed on {project_dir}: {result}")
+    return result
+
+
+def benchmark_project(
+    tmp_dir: Path, num_tests: int, marked_share: float, functions: int, depth: int
+) -> dict[str, Any]:
+    """Runs a generated project with and without the plugin."""
+    project_dir = tmp_dir / f"project_{num_tests}_{marked_share}_{functions}_{depth}"
+    generate_project(project_dir, num_tests, marked_share, functions, depth)
+    without_plugin = run_pytest(project_dir, "-p", "no:pytest_idempotent")
+    with_plugin = run_pytest(project_dir, "-p", "pytest_idempotent")
+    per_test_s = (
+        with_plugin["run_s"] / with_plugin["collected"]
+        - without_plugin["run_s"] / without_plugin["collected"]
+    )
+    return {
+        "tests": num_tests,
+        "marked_share": marked_share,
+        "functions": functions,
+        "depth": depth,
+        "without_plugin": without_plugin,
+        "with_plugin": with_plugin,
+        "collection_s": with_plugin["collection_s"],
+        "run_s": with_plugin["run_s"],
+        "hook_overhead_us": per_test_s * 1e6,
+        "max_rss_mib": with_plugin["max_rss_mib"],
+    }
+
+
+def benchmark_run_twice(tmp_dir: Path, depth: int, number: int) -> dict[str, Any]:
+    """Times calls to a chain of depth nested @idempotent functions."""
+    project_dir = tmp_dir / f"overhead_{depth}"
+    generate_project(project_dir, 0, 0, 1, depth)
+    test_file = project_dir / "tests" / "test_overhead.py"
+    test_file.write_text(
+        textwrap.dedent(OVERHEAD_TEST.format(top=depth - 1, number=number))
+    )
+    output = project_dir / "overhead.jsonl"
+    run_pytest(
+        project_dir, "-p", "pytest_idempotent", env={"BENCHMARK_OUTPUT": str(output)}
+    )
+    result: dict[str, Any] = {"depth": depth}
+    for line in output.read_text().splitlines():
+        timing = json.loads(line)
+        result[f"{timing['variant']}_overhead_ns"] = (
+            timing["upsert_ns"] - timing["plain_ns"]
+        )
+    return result
+
+
+def benchmark_fork(tmp_dir: Path, number: int) -> dict[str, Any]:
+    """Times checked calls with isolation="fork" against checked calls without."""
+    project_dir = tmp_dir / "fork_overhead"
+    generate_project(project_dir, 0, 0, 1, 1)
+    (project_dir / "tests" / "test_fork_overhead.py").write_text(
+        textwrap.dedent(FORK_TEST.format(number=number))
+    )
+    output = project_dir / "fork.json"
+    run_pytest(
+        project_dir, "-p", "pytest_idempotent", env={"BENCHMARK_OUTPUT": str(output)}
+    )
+    timing = json.loads(output.read_text())
+    return {"fork_overhead_us": (timing["forked_ns"] - timing["upsert_ns"]) / 1e3}
+
+
+def get_commit() -> str | None:
+    """Returns the current git commit of the repository, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            check=True,
+            capture_output=True,
+            cwd=REPO_ROOT,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    """Prints the results, with the relative change from the baseline, if any."""
+    baseline_projects = {
+        get_project_key(project): project
+        for project in (baseline or {}).get("projects", ())
+    }
+    for project in results["projects"]:
+        previous = baseline_projects.get(get_project_key(project))
+        columns = [
+            f"{project['tests']:>7} tests",
+            f"{project['marked_share']:>4.0%} marked",
+            f"{project['functions']:>3} functions",
+            f"depth {project['depth']}",
+        ]
+        for metric in METRICS:
+            column = f"{metric}: {project[metric]:9.2f}"
+            if previous is not None and previous[metric]:
+                change = project[metric] / previous[metric] - 1
+                column += f" ({change:+.0%})"
+            columns.append(column)
+        print("   ".join(columns))
+    baseline_timings = {
+        timing["depth"]: timing for timing in (baseline or {}).get("run_twice", ())
+    }
+    for timing in results["run_twice"]:
+        previous = baseline_timings.get(timing["depth"])
+        columns = [f"run_twice depth {timing['depth']}"]
+        for variant in ("no_idempotency", "check_idempotency"):
+            metric = f"{variant}_overhead_ns"
+            column = f"{variant}: {timing[metric]:8.1f} ns/call"
+            if previous is not None and previous[metric]:
+                column += f" ({timing[metric] / previous[metric] - 1:+.0%})"
+            columns.append(column)
+        print("   ".join(columns))
+    fork_overhead_us = results["fork"]["fork_overhead_us"]
+    column = f"isolation=fork: {fork_overhead_us:8.1f} us/call"
+    previous_fork = (baseline or {}).get("fork")
+    if previous_fork and previous_fork["fork_overhead_us"]:
+        column += f" ({fork_overhead_us / previous_fork['fork_overhead_us'] - 1:+.0%})"
+    print(column)
+
+
+def get_project_key(project: dict[str, Any]) -> tuple[Any, ...]:
+    return (
+        project["tests"],
+        project["marked_share"],
+        project["functions"],
+        project["depth"],
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--marked-shares", type=float, nargs="+", default=[0.1, 0.5])
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--functions", type=int, nargs="+", default=[10])
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--fork-number", type=int, default=2_000)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="JSON results of a previous run.")
+    args = parser.parse_args()
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        results = {
+            "commit": get_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pytest": pytest.__version__,
+            "projects": [
+                benchmark_project(tmp_dir, size, share, functions, depth)
+                for size, share, functions, depth in itertools.product(
+                    args.sizes, args.marked_shares, args.functions, args.depths
+                )
+            ],
+            "run_twice": [
+                benchmark_run_twice(tmp_dir, depth, args.number)
+                for depth in args.depths
+            ],
+            "fork": benchmark_fork(tmp_dir, args.fork_number),
+        }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print_results(results, baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
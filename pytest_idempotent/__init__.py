@@ -1,20 +1,80 @@
 from __future__ import annotations
 
+import abc
+import ast
+import asyncio
+import fnmatch
+import gc
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+import random
+import re
+import reprlib
+import select
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
 import warnings
-from collections.abc import Callable, Iterator
-from functools import wraps
-from typing import TYPE_CHECKING, Any, TypeVar, cast, overload
+import zlib
+from collections import OrderedDict, deque
+from collections.abc import (
+    Callable,
+    Collection,
+    Generator,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+)
+from collections.abc import Set as AbstractSet
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import lru_cache, wraps
+from importlib.machinery import ModuleSpec, PathFinder
+from itertools import islice
+from pathlib import Path
+from time import perf_counter_ns
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    NamedTuple,
+    Protocol,
+    Tuple,
+    TypedDict,
+    TypeVar,
+    Union,
+    cast,
+    overload,
+)
 from unittest.mock import patch
 
 import pytest
 
 if TYPE_CHECKING:
+    from contextvars import Token
+
+    from _pytest.cacheprovider import Cache
     from _pytest.config import Config, PytestPluginManager
+    from _pytest.config.argparsing import Parser
     from _pytest.fixtures import SubRequest
     from _pytest.python import Function, Metafunc
     from _pytest.runner import CallInfo
+    from _pytest.terminal import TerminalReporter
 
 _F = TypeVar("_F", bound=Callable[..., Any])
+_Outcome = Tuple[Any, Union[Exception, None]]  # (result, exception) of a single run
+# Returns None if two return values are equal, or else describes their differences.
+Comparator = Callable[[Any, Any], Union[str, None]]
 NO_IDEMPOTENCY_ID = "no_idempotency"
 CHECK_IDEMPOTENCY_ID = "check_idempotency"
 MISSING_PYTEST_MARKER = (
@@ -30,12 +90,15 @@ MISSING_PYTEST_MARKER = (
     "- Disable this enforcing check globally by adding the following function "
     "to your conftest.py: \n"
     "    def pytest_idempotent_enforce_tests() -> bool:\n"
-    "        return False"
+    "        return False\n\n"
+    "- Mark the tests that call @idempotent functions automatically from the next "
+    'session, by returning "auto" from the same function.'
 )
 IDEMPOTENCY_TEST_OUT_OF_ORDER = (
-    "Idempotency tests are not in the correct sorted order.\n"
+    "Idempotency test ran without the result of its regular test.\n"
     "Running this idempotency test regardless, but to optimize test runtime "
-    "it is recommended that you disable the random ordering of your tests."
+    "it is recommended that you also select the regular test. With pytest-xdist, "
+    "use `--dist loadgroup` to run both tests on the same worker."
 )
 SKIPPING_IDEMPOTENCY_CHECK = (
     "The first run of this test either failed or did not contain "
@@ -46,13 +109,92 @@ MISSING_IDEMPOTENT_FUNCTION = (
     "an @idempotent decorated function.\nEither remove the marker or use "
     "@pytest.mark.idempotent(enabled=False)."
 )
-RETURN_VALUES_NOT_EQUAL = (
-    "Return values of idempotent functions must be equal: {} != {}"
+RETURN_VALUES_NOT_EQUAL = "Return values of idempotent functions must be equal: {}"
+MAX_DIFFERENCES = 5  # differing keys or positions shown in failure messages
+STATIC_ANALYSIS_MISSED_FUNCTION = (
+    "Test is marked with @pytest.mark.idempotent and called an @idempotent "
+    "decorated function, but static analysis did not find the call, so the "
+    "idempotency check was not run.\nCall the function directly from the test "
+    "or disable --idempotent-static-analysis."
 )
+STATIC_INDEX_CACHE_KEY = "pytest_idempotent/static_index"
+FIRST_RUNS_CACHE_KEY = "pytest_idempotent/first_runs_by_file/{}"
+FIRST_RUN_FILES_CACHE_KEY = "pytest_idempotent/first_run_files"
+FIRST_RUNS_FLUSH_SIZE = 256  # results buffered before writing them to the cache
+REACHED_FUNCTIONS_CACHE_KEY = "pytest_idempotent/reached_functions"
+AUTO_MARKED_TESTS_CACHE_KEY = "pytest_idempotent/auto_marked_tests"
+VERIFIED_CALLS_MAXSIZE = 1024
 FAILED_TO_RAISE_IDEMPOTENCY_EXCEPTION = (
     "@idempotent decorator has raises_exception={} but "
     "the second run did not trigger the expected Exception."
 )
+CONCURRENT_RUNS_DID_NOT_RAISE = (
+    "@idempotent decorator has raises_exception={} but "
+    "{} of {} concurrent runs did not trigger the expected Exception."
+)
+STREAM_ITEMS_NOT_EQUAL = (
+    "Streams of idempotent functions must be equal, but item {} differs: {}"
+)
+END_OF_STREAM = object()  # returned when a stream is exhausted
+SECOND_RUN_TOO_SLOW = (
+    "@idempotent decorator has max_second_run_ratio={} but the second run "
+    "took {:.3f}ms, which is {:.2f}x the first run's {:.3f}ms."
+)
+SECOND_RUN_RETAINED_MEMORY = (
+    "@idempotent decorator has check_memory=True but the second run retained "
+    "{} bytes, more than the idempotent_memory_threshold of {} bytes.\n"
+    "Top allocating lines:\n{}"
+)
+MEMORY_TOP_LINES = 5
+ARGUMENTS_MUTATED = (
+    "@idempotent decorator has check_args=True but the second run "
+    "mutated these arguments: {}"
+)
+STATE_CHANGED = "The second run changed the {}:\n{}"
+SECOND_RUN_RAISED_IN_CHILD = "The second run raised in the forked child process:\n{}"
+CHILD_EXITED_WITHOUT_OUTCOME = (
+    "The forked child process of the second run exited with status {} "
+    "without reporting its outcome."
+)
+CHILD_TIMED_OUT = (
+    "The forked child process of the second run did not finish within the "
+    "idempotent_fork_timeout of {} seconds, and was killed."
+)
+SQLITE_ROW_HASH = "pytest_idempotent_row_hash"
+# Values of these types are immutable, so their repr is their fingerprint. Strings
+# and bytes are encoded as they are instead, unless they are short items of a
+# container, and long strings are encoded in chunks of STRING_CHUNK_SIZE chars.
+# Containers of such items are encoded by the reprs of chunks of REPR_CHUNK_SIZE
+# items, and sets by the repr of their sorted items up to that size.
+ATOMIC_TYPES = frozenset(
+    {int, float, complex, str, bytes, bool, type(None), range, type, frozenset}
+)
+MAX_REPR_ITEM_LENGTH = 1024
+REPR_CHUNK_SIZE = 1024
+STRING_CHUNK_SIZE = 1 << 20
+ARGUMENT_NOT_FINGERPRINTED = (
+    "@idempotent decorator has check_args=True but {} objects have no attributes "
+    "or value to fingerprint, so their mutations are not detected."
+)
+# The first filter_traces() call compiles these patterns with fnmatch and re and
+# fills the isinstance cache of abc, so the frames of those modules are excluded too.
+MEMORY_TRACE_FILTERS = tuple(
+    tracemalloc.Filter(inclusive=False, filename_pattern=pattern)
+    for pattern in (
+        tracemalloc.__file__,
+        __file__,
+        fnmatch.__file__,
+        re.__file__,
+        str(
+            Path(re.__file__).with_name(
+                "_*.py" if re.__file__.endswith("__init__.py") else "sre_*.py"
+            )
+        ),
+        abc.ABCMeta.__instancecheck__.__code__.co_filename,
+        "<frozen importlib.*>",
+        "<unknown>",
+    )
+)
 
 
 # ------------------- Exceptions -------------------
@@ -74,27 +216,1030 @@ class FailedToRaiseIdempotencyException(Exception):
     """Idempotent function did not raise an exception on the second run."""
 
 
+class SecondRunTooSlow(Exception):
+    """Idempotent function did not short-circuit on the second run."""
+
+
+class SecondRunRetainedMemory(Exception):
+    """Idempotent function kept allocating memory on the second run."""
+
+
+class ArgumentsMutated(Exception):
+    """Idempotent function mutated its arguments again on the second run."""
+
+
+class StateChanged(Exception):
+    """Idempotent function changed the state captured by a StateProbe."""
+
+
+class ForkedRunFailed(Exception):
+    """The second run, isolated in a forked child process, did not complete."""
+
+
 # ------------------- GlobalState -------------------
 
 
-class GlobalState:
+class TimingRecord(NamedTuple):
+    """Calls and durations of an @idempotent function during a single test."""
+
+    nodeid: str
+    function: str
+    calls: int
+    checked_calls: int
+    run_1_ns: int
+    run_2_ns: int
+
+
+class FirstRun(TypedDict):
     """
-    Store essential metadata needed during the test runs.
+    Source hash of a test function, with the results of its NO_IDEMPOTENCY_ID tests
+    by parameter id, stored in the pytest cache.
+    """
+
+    source_hash: str
+    results: dict[str, bool]
+
+
+class ReachedFunctions(TypedDict):
+    """
+    Source hashes of a test function and of the @idempotent functions it reached,
+    with the ids of its CHECK_IDEMPOTENCY_ID tests that passed with these hashes,
+    and of those that were collected, which are only known when writing the cache.
+    """
+
+    source_hash: str
+    functions: dict[str, str | None]
+    passed: list[str]
+    variants: list[str]
 
+
+class TestState:
+    """
+    Store the metadata of a single test, read by every @idempotent function call.
+
+    - item: a reference to the current pytest test context.
     - should_run_twice: used to toggle the idempotency patch on/off.
-    - current_test: a reference to the current pytest test context.
+    - has_marker: True if the test has the @pytest.mark.idempotent marker,
+        computed once per test to keep the per-call overhead low.
+    - concurrent: the `concurrent` argument of the marker, if any.
+    - marker_probes: True if the marker has `probes` or `watch_paths`.
+    - probes: the StateProbes that snapshot external state after each run. They are
+        created once the fixtures are set up.
     - contains_idempotent_function: True if an @idempotent decorated function called.
-    - all_test_runs: dict mapping item.nodeid to bool(NO_IDEMPOTENCY_ID test passed
-        and test contained at least 1 @idempotent decorated function)
+    - samplers: random generators of each sampled @idempotent function.
+    - verified_calls: LRU of the (function, arguments) fingerprints already checked,
+        used by @idempotent(check_once_per_args=True).
+    - timings: maps each called @idempotent function to its
+        [calls, checked calls, run 1 ns, run 2 ns], or None if timing is disabled.
+    - reached_functions: the @idempotent functions called by the test, or None if
+        incremental mode is disabled.
+    - lock: guards the mutable state above, which may be updated from threads.
+    - finished: True once the test is torn down. Contexts copied during the test,
+        e.g. by a module-scoped async fixture, keep the TestState bound after that.
     """
 
-    should_run_twice: bool = False
-    current_test: Function | None = None
-    contains_idempotent_function: bool = True  # default True until test begins
-    all_test_runs: dict[str, bool] = {}  # noqa: RUF012
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, item: Function | None = None) -> None:
+        marker = None if item is None else item.get_closest_marker("idempotent")
+        self.item = item
+        self.should_run_twice = False
+        self.has_marker = marker is not None
+        self.concurrent: int | None = (
+            None if marker is None else marker.kwargs.get("concurrent")
+        )
+        self.marker_probes = marker is not None and bool(
+            marker.kwargs.get("probes") or marker.kwargs.get("watch_paths")
+        )
+        self.probes: list[StateProbe] = []
+        self.contains_idempotent_function = True  # default True until test begins
+        self.samplers: dict[Callable[..., Any], random.Random] = {}
+        self.verified_calls: OrderedDict[Hashable, None] = OrderedDict()
+        self.timings: dict[Callable[..., Any], list[int]] | None = (
+            None if _global_state.timing_records is None else {}
+        )
+        self.reached_functions: set[Callable[..., Any]] | None = (
+            None if _global_state.checked_definitions is None else set()
+        )
+        self.lock = threading.Lock()
+        self.finished = False
+
+
+class GlobalState:
+    """
+    Store essential metadata needed during the test runs.
+
+    - test_state: the TestState of the current test. It is also bound to the
+        _test_state context variable, which is inherited by asyncio tasks and
+        copied contexts. Threads without a bound TestState, and contexts
+        whose bound TestState has finished, use this one.
+    - sample_seed: seed used to choose the sampled calls of @idempotent(sample_rate=).
+    - sampled_calls: number of [checked, skipped] sampled calls in this session.
+    - static_index: collection-time index of functions that reach an @idempotent
+        function, or None if static analysis is disabled.
+    - timing_records: the TimingRecords of all finished tests, or None if timing
+        is disabled.
+    - checked_definitions: in incremental mode, the ReachedFunctions of each test
+        function whose idempotency checks passed, or None if one of them failed.
+        None if incremental mode is disabled.
+    - idempotent_functions: in incremental mode, every @idempotent function by name.
+    - check_variants: in incremental mode, the ids of the CHECK_IDEMPOTENCY_ID tests
+        collected for each test function, before deselection.
+    - first_runs: the FirstRun of test functions whose NO_IDEMPOTENCY_ID tests ran
+        in this session, not yet written to the pytest cache.
+    - buffered_first_runs: number of results in first_runs.
+    - cached_first_runs: the path and cached FirstRuns of the last test file whose
+        FirstRuns were loaded from or written to the pytest cache, if any.
+    - first_run_files: the test files with cached FirstRuns, loaded from the pytest
+        cache on first use.
+    - unchanged_tests: number of test functions whose idempotency checks were not
+        generated by incremental mode.
+    - auto_marked_tests: test functions recorded by previous sessions in the "auto"
+        enforcement mode, which are treated as marked with @pytest.mark.idempotent.
+    - recorded_tests: test functions recorded in this session in the "auto"
+        enforcement mode: True if they called an @idempotent function, or False if
+        they are automatically marked but no longer call any.
+    """
+
+    test_state: TestState
+    sample_seed: str = "0"
+    sampled_calls: list[int] = [0, 0]  # noqa: RUF012
+    static_index: StaticIndex | None = None
+    timing_records: list[TimingRecord] | None = None
+    checked_definitions: dict[str, ReachedFunctions | None] | None = None
+    idempotent_functions: dict[str, Callable[..., Any]] = {}  # noqa: RUF012
+    check_variants: dict[str, set[str]] = {}  # noqa: RUF012
+    first_runs: dict[str, FirstRun] = {}  # noqa: RUF012
+    buffered_first_runs = 0
+    cached_first_runs: tuple[str, dict[str, FirstRun]] | None = None
+    first_run_files: set[str] | None = None
+    unchanged_tests: int = 0
+    auto_marked_tests: frozenset[str] = frozenset()
+    recorded_tests: dict[str, bool] = {}  # noqa: RUF012
 
 
 _global_state = GlobalState()  # global variable needed for idempotency checking
+_global_state.test_state = TestState()
+_test_state: ContextVar[TestState] = ContextVar("pytest_idempotent_test_state")
+# Number of checked @idempotent calls running in this context. The calls nested in a
+# checked call are only checked themselves with @idempotent(nested="all").
+_checked_call_depth: ContextVar[int] = ContextVar(
+    "pytest_idempotent_checked_call_depth", default=0
+)
+TEST_STATE_TOKEN_KEY: pytest.StashKey[Token[TestState]] = pytest.StashKey()
+# Set at collection time on both tests of each idempotency pair: True for the
+# CHECK_IDEMPOTENCY_ID test, and False for the NO_IDEMPOTENCY_ID test.
+IS_CHECK_TEST_KEY: pytest.StashKey[bool] = pytest.StashKey()
+# Set on each NO_IDEMPOTENCY_ID test whose CHECK_IDEMPOTENCY_ID test is selected.
+CHECK_TEST_KEY: pytest.StashKey[Function] = pytest.StashKey()
+# Set on a CHECK_IDEMPOTENCY_ID test once its NO_IDEMPOTENCY_ID test has run:
+# True if it passed and called at least 1 @idempotent decorated function. The
+# result is also written to the pytest cache, to be reused by later sessions.
+FIRST_RUN_RESULT_KEY: pytest.StashKey[bool] = pytest.StashKey()
+# Set on the tests that the "auto" enforcement mode marked with @pytest.mark.idempotent.
+AUTO_MARKED_KEY: pytest.StashKey[bool] = pytest.StashKey()
+
+
+def get_test_state() -> TestState:
+    """
+    Returns the TestState bound to this context, or the current test's one if none
+    is bound, or if the bound one belongs to a test that has finished.
+    """
+    state = _test_state.get(None)
+    if state is None or state.finished:
+        return _global_state.test_state
+    return state
+
+
+# ------------------- Static Analysis -------------------
+
+
+class FunctionIndex(TypedDict):
+    decorators: list[str]
+    names: list[str]
+    attrs: list[str]
+    methods: list[str]
+
+
+class ModuleIndex(TypedDict):
+    imports: dict[str, str]
+    classes: list[str]
+    functions: dict[str, FunctionIndex]
+
+
+# A node is a (module name, qualname) pair of a function or class.
+_Node = Tuple[str, str]
+_IDEMPOTENT_TARGET = ("", "")  # returned when a reference is the decorator itself
+
+
+class StaticIndex:
+    """
+    Collection-time index of the functions that can reach an @idempotent function.
+
+    Modules are parsed with `ast` and never imported, not even their parent
+    packages. Only modules under the rootdir are followed, so calls into third-party
+    code are assumed to not reach any @idempotent function. Module indexes are
+    cached by file hash in the pytest cache.
+    """
+
+    def __init__(
+        self, decorator_path: str, rootpath: Path, cache: Cache | None
+    ) -> None:
+        self.decorator_path = decorator_path
+        self.rootpath = rootpath.resolve()
+        self.cache = cache
+        self.cached_modules: dict[str, tuple[str, ModuleIndex]] = {
+            name: (digest, index)
+            for name, (digest, index) in (
+                {} if cache is None else cache.get(STATIC_INDEX_CACHE_KEY, {})
+            ).items()
+        }
+        self.modules: dict[str, ModuleIndex | None] = {}
+        self.reaching: dict[_Node, bool] = {}
+        self.changed = False
+
+    def save(self) -> None:
+        """Writes the module indexes parsed during this session to the pytest cache."""
+        if self.cache is not None and self.changed:
+            self.cache.set(STATIC_INDEX_CACHE_KEY, self.cached_modules)
+
+    def get_module(self, module_name: str) -> ModuleIndex | None:
+        if module_name not in self.modules:
+            self.modules[module_name] = self.load_module(module_name)
+        return self.modules[module_name]
+
+    def load_module(self, module_name: str) -> ModuleIndex | None:
+        path = find_module_path(module_name)
+        if path is None or self.rootpath not in path.parents:
+            return None
+        source = path.read_bytes()
+        digest = hashlib.sha256(source).hexdigest()
+        cached = self.cached_modules.get(module_name)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        try:
+            index = build_module_index(
+                source, module_name, is_package=path.name == "__init__.py"
+            )
+        except (SyntaxError, ValueError):
+            return None
+        self.cached_modules[module_name] = (digest, index)
+        self.changed = True
+        return index
+
+    def test_reaches(self, metafunc: Metafunc) -> bool:
+        """
+        Returns True if the test function can reach a function decorated with the
+        configured @idempotent decorator. Like the runtime check, calls made from
+        fixtures are not counted.
+        """
+        return self.reaches(
+            [(metafunc.module.__name__, metafunc.function.__qualname__)]
+        )
+
+    def reaches(self, start: Iterable[_Node]) -> bool:
+        """Breadth-first search of the call graph for an @idempotent function."""
+        queue = deque(start)
+        visited = set(queue)
+        while queue:
+            node = queue.popleft()
+            known = self.reaching.get(node)
+            if known is not None:
+                if known:
+                    return True
+                continue
+            successors = self.get_successors(node)
+            if successors is None:
+                self.reaching[node] = True
+                return True
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    queue.append(successor)
+        # Every node reachable from a visited node was also visited.
+        for node in visited:
+            self.reaching[node] = False
+        return False
+
+    def get_successors(self, node: _Node) -> list[_Node] | None:
+        """
+        Returns the functions and classes referenced by the node, or None if
+        the node is an @idempotent function or references the decorator itself.
+        """
+        module_name, qualname = node
+        module = self.get_module(module_name)
+        if module is None:
+            return []
+        if qualname in module["classes"]:
+            prefix = f"{qualname}."
+            return [
+                (module_name, name)
+                for name in module["functions"]
+                if name.startswith(prefix)
+            ]
+        function = module["functions"].get(qualname)
+        if function is None:
+            return []
+        if self.decorator_path in function["decorators"]:
+            return None
+
+        successors = [
+            self.resolve_local(module_name, module, name) for name in function["names"]
+        ]
+        class_name = qualname.rpartition(".")[0]
+        for attr in function["attrs"]:
+            root, _, rest = attr.partition(".")
+            if root in module["imports"]:
+                successors.append(
+                    self.resolve_symbol(f"{module['imports'][root]}.{rest}")
+                )
+            elif root in {"self", "cls"} and class_name:
+                successors.append((module_name, f"{class_name}.{rest}"))
+            elif root in module["classes"] or root in module["functions"]:
+                successors.append((module_name, attr))
+            else:
+                successors.extend(
+                    self.resolve_method(module_name, module, rest.partition(".")[0])
+                )
+        for method in function["methods"]:
+            successors.extend(self.resolve_method(module_name, module, method))
+
+        if _IDEMPOTENT_TARGET in successors:
+            return None
+        return [successor for successor in successors if successor is not None]
+
+    def resolve_local(
+        self, module_name: str, module: ModuleIndex, name: str
+    ) -> _Node | None:
+        if name in module["functions"] or name in module["classes"]:
+            return module_name, name
+        if name in module["imports"]:
+            return self.resolve_symbol(module["imports"][name])
+        return None
+
+    def resolve_method(
+        self, module_name: str, module: ModuleIndex, method: str
+    ) -> list[_Node]:
+        """Resolves obj.method to the methods of local or imported classes."""
+        nodes = []
+        for name in (*module["classes"], *module["imports"]):
+            node = self.resolve_local(module_name, module, name)
+            if node is None or node == _IDEMPOTENT_TARGET:
+                continue
+            class_module = self.get_module(node[0])
+            if class_module is not None and node[1] in class_module["classes"]:
+                candidate = f"{node[1]}.{method}"
+                if candidate in class_module["functions"]:
+                    nodes.append((node[0], candidate))
+        return nodes
+
+    def resolve_symbol(self, full_name: str, depth: int = 0) -> _Node | None:
+        """Resolves a fully-qualified name such as pkg.module.func to a node."""
+        if full_name == self.decorator_path:
+            return _IDEMPOTENT_TARGET
+        parts = full_name.split(".")
+        for i in range(len(parts) - 1, 0, -1):
+            module_name = ".".join(parts[:i])
+            module = self.get_module(module_name)
+            if module is None:
+                continue
+            qualname = ".".join(parts[i:])
+            if qualname in module["functions"] or qualname in module["classes"]:
+                return module_name, qualname
+            if parts[i] in module["imports"] and depth < 8:
+                # Follow re-exports, e.g. `from .utils import func` in __init__.py.
+                return self.resolve_symbol(
+                    ".".join((module["imports"][parts[i]], *parts[i + 1 :])),
+                    depth + 1,
+                )
+            return None
+        return None
+
+
+def build_module_index(
+    source: bytes, module_name: str, is_package: bool
+) -> ModuleIndex:
+    """Parses a module into its imports, classes and function references."""
+    tree = ast.parse(source)
+    package = module_name if is_package else module_name.rpartition(".")[0]
+    imports: dict[str, str] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname is None:
+                    root = alias.name.partition(".")[0]
+                    imports[root] = root
+                else:
+                    imports[alias.asname] = alias.name
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parts = package.split(".")
+                parent = ".".join(parts[: len(parts) - node.level + 1])
+                base = ".".join(part for part in (parent, base) if part)
+            for alias in node.names:
+                if alias.name != "*":
+                    imports[alias.asname or alias.name] = (
+                        f"{base}.{alias.name}" if base else alias.name
+                    )
+
+    def resolve_decorator(decorator: ast.expr) -> str:
+        if isinstance(decorator, ast.Call):
+            decorator = decorator.func
+        dotted_name = get_dotted_name(decorator) or ""
+        root, _, rest = dotted_name.partition(".")
+        resolved = imports.get(root, f"{module_name}.{root}")
+        return f"{resolved}.{rest}" if rest else resolved
+
+    index = ModuleIndex(imports=imports, classes=[], functions={})
+
+    def visit(body: list[ast.stmt], prefix: str) -> None:
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                index["classes"].append(f"{prefix}{node.name}")
+                visit(node.body, f"{prefix}{node.name}.")
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                function = FunctionIndex(
+                    decorators=[resolve_decorator(d) for d in node.decorator_list],
+                    names=[],
+                    attrs=[],
+                    methods=[],
+                )
+                add_references(function, node.body)
+                index["functions"][f"{prefix}{node.name}"] = function
+
+    visit(tree.body, "")
+    return index
+
+
+def add_references(function: FunctionIndex, body: list[ast.stmt]) -> None:
+    """Adds the names and attributes referenced inside a function body."""
+    names: set[str] = set()
+    attrs: set[str] = set()
+    methods: set[str] = set()
+    stack: list[ast.AST] = list(body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+            continue
+        if isinstance(node, ast.Attribute):
+            dotted_name = get_dotted_name(node)
+            if dotted_name is not None:
+                attrs.add(dotted_name)
+                continue
+            methods.add(node.attr)
+        stack.extend(ast.iter_child_nodes(node))
+    function["names"] = sorted(names)
+    function["attrs"] = sorted(attrs)
+    function["methods"] = sorted(methods)
+
+
+def get_dotted_name(node: ast.expr) -> str | None:
+    """Returns e.g. "a.b.c" for the expression a.b.c, or None if it is not a name."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = get_dotted_name(node.value)
+        return None if base is None else f"{base}.{node.attr}"
+    return None
+
+
+def find_module_path(module_name: str) -> Path | None:
+    """Returns the source file of a module, preferring already-imported modules."""
+    origin = getattr(sys.modules.get(module_name), "__file__", None)
+    if origin is None:
+        try:
+            spec = find_spec_without_import(module_name)
+        except Exception:  # noqa: BLE001
+            return None
+        origin = None if spec is None else spec.origin
+    if origin is None or not origin.endswith(".py"):
+        return None
+    return Path(origin).resolve()
+
+
+def find_spec_without_import(module_name: str) -> ModuleSpec | None:
+    """
+    Finds the spec of a module like importlib.util.find_spec, but without importing
+    its parent packages: submodules are searched in the locations of their parent's
+    spec, so no package __init__ code runs.
+    """
+    parent_name, _, _ = module_name.rpartition(".")
+    if not parent_name:
+        return importlib.util.find_spec(module_name)
+    parent = sys.modules.get(parent_name)
+    if parent is not None:
+        locations = getattr(parent, "__path__", None)
+    else:
+        parent_spec = find_spec_without_import(parent_name)
+        locations = (
+            None if parent_spec is None else parent_spec.submodule_search_locations
+        )
+    if locations is None:
+        return None
+    return PathFinder.find_spec(module_name, list(locations))
+
+
+# ------------------- Comparators -------------------
+
+
+_bounded_repr = reprlib.Repr()
+_bounded_repr.maxstring = _bounded_repr.maxother = 80
+
+
+class Comparators:
+    """
+    Registry of the comparators used by @idempotent(equal_return=True).
+
+    Comparators are registered by type, or by "module.QualName" so that optional
+    libraries are never imported. The comparator of the first return value's type,
+    or of its closest registered base class, is resolved once per type. Lists, tuples
+    and dicts are compared element by element with the comparators of their
+    elements, e.g. NumPy arrays in a tuple.
+    """
+
+    def __init__(self, registries: Iterable[Mapping[type | str, Comparator]]) -> None:
+        self.registry: dict[type | str, Comparator] = {
+            list: self.compare_containers,
+            tuple: self.compare_containers,
+            dict: self.compare_containers,
+            **BUILTIN_COMPARATORS,
+        }
+        for registry in registries:
+            self.registry.update(registry)
+        self.resolved: dict[type, Comparator] = {}
+
+    def compare(self, run_1: Any, run_2: Any) -> str | None:
+        cls = type(run_1)
+        if type(run_2) is not cls:
+            return compare_objects(run_1, run_2)
+        return self.get_comparator(cls)(run_1, run_2)
+
+    def get_comparator(self, cls: type) -> Comparator:
+        comparator = self.resolved.get(cls)
+        if comparator is None:
+            comparator = self.resolved[cls] = self.resolve(cls)
+        return comparator
+
+    def resolve(self, cls: type) -> Comparator:
+        for base in cls.__mro__:
+            for key in (base, f"{base.__module__}.{base.__qualname__}"):
+                comparator = self.registry.get(key)
+                if comparator is not None:
+                    return comparator
+        return compare_objects
+
+    def compare_containers(self, run_1: Any, run_2: Any) -> str | None:
+        """Compares lists, tuples or dicts, showing the first differing elements."""
+        if are_equal(run_1, run_2):
+            return None
+        differences = list(islice(self.find_differences(run_1, run_2), MAX_DIFFERENCES))
+        if not differences:
+            return None
+        return format_differences(summarize(run_1, run_2), differences)
+
+    def find_differences(
+        self, run_1: Any, run_2: Any, prefix: str = ""
+    ) -> Iterator[tuple[str, str]]:
+        """
+        Yields the positions of the differing elements of two lists, tuples or dicts,
+        through nested containers, with the summary of their differences.
+        """
+        missing = object()
+        if isinstance(run_1, dict):
+            elements: Iterable[tuple[str, Any, Any]] = (
+                (
+                    f"[{_bounded_repr.repr(key)}]",
+                    run_1.get(key, missing),
+                    run_2.get(key, missing),
+                )
+                for key in [*run_1, *(key for key in run_2 if key not in run_1)]
+            )
+        else:
+            elements = (
+                (f"[{index}]", value_1, value_2)
+                for index, (value_1, value_2) in enumerate(zip(run_1, run_2))
+            )
+        for position, value_1, value_2 in elements:
+            if value_1 is missing or value_2 is missing:
+                yield (
+                    prefix + position,
+                    " != ".join(
+                        "<missing>" if value is missing else _bounded_repr.repr(value)
+                        for value in (value_1, value_2)
+                    ),
+                )
+                continue
+            cls = type(value_1)
+            if (
+                type(value_2) is cls
+                and self.get_comparator(cls) == self.compare_containers
+            ):
+                if not are_equal(value_1, value_2):
+                    yield from self.find_differences(
+                        value_1, value_2, prefix + position
+                    )
+                continue
+            difference = self.compare(value_1, value_2)
+            if difference is not None:
+                yield prefix + position, difference.partition("\n")[0]
+        if not isinstance(run_1, dict) and len(run_1) != len(run_2):
+            yield f"{prefix}len", summarize(len(run_1), len(run_2))
+
+
+def are_equal(run_1: Any, run_2: Any) -> bool:
+    """
+    Compares with ==, returning False if the result is ambiguous, e.g. for lists of
+    NumPy arrays, whose elements are then compared one by one.
+    """
+    try:
+        return bool(run_1 == run_2)
+    except ValueError:
+        return False
+
+
+def format_differences(summary: str, differences: Iterable[tuple[str, str]]) -> str:
+    """Adds the first differences, as positions with descriptions, to the summary."""
+    details = ", ".join(
+        f"{position}: {description}"
+        for position, description in islice(differences, MAX_DIFFERENCES)
+    )
+    return f"{summary}\nFirst differences: {details}" if details else summary
+
+
+def summarize(run_1: Any, run_2: Any) -> str:
+    """Returns the bounded reprs of two values."""
+    return f"{_bounded_repr.repr(run_1)} != {_bounded_repr.repr(run_2)}"
+
+
+def compare_objects(run_1: Any, run_2: Any) -> str | None:
+    """Compares with ==, e.g. values of different types such as arrays and lists."""
+    if are_equal(run_1, run_2):
+        return None
+    return summarize(run_1, run_2)
+
+
+def compare_bytes(run_1: Any, run_2: Any) -> str | None:
+    """Compares bytes-like objects with memcmp, showing the first differing offset."""
+    if run_1 == run_2:
+        return None
+    data_1, data_2 = memoryview(run_1).tobytes(), memoryview(run_2).tobytes()
+    # Binary search of the first differing byte, with slice comparisons.
+    low, high = 0, min(len(data_1), len(data_2))
+    while low < high:
+        middle = (low + high) // 2
+        if data_1[low : middle + 1] == data_2[low : middle + 1]:
+            low = middle + 1
+        else:
+            high = middle
+    differences = [
+        (f"[{low}:]", summarize(data_1[low : low + 16], data_2[low : low + 16]))
+    ]
+    if len(data_1) != len(data_2):
+        differences.append(("len", summarize(len(data_1), len(data_2))))
+    return format_differences(summarize(run_1, run_2), differences)
+
+
+def compare_ndarrays(run_1: Any, run_2: Any) -> str | None:
+    """Compares NumPy arrays elementwise, treating NaNs at the same index as equal."""
+    numpy = sys.modules["numpy"]
+    if run_1.shape != run_2.shape:
+        return f"Array shapes differ: {run_1.shape} != {run_2.shape}"
+    not_equal = numpy.asarray(run_1 != run_2)
+    if run_1.dtype.kind in "fc" and run_2.dtype.kind in "fc":
+        not_equal &= ~(numpy.isnan(run_1) & numpy.isnan(run_2))
+    if not not_equal.any():
+        return None
+    return format_differences(
+        f"{numpy.count_nonzero(not_equal)} of {not_equal.size} array elements differ",
+        (
+            (str(index), summarize(run_1.item(index), run_2.item(index)))
+            for index in map(tuple, numpy.argwhere(not_equal).tolist())
+        ),
+    )
+
+
+def compare_dataframes(run_1: Any, run_2: Any) -> str | None:
+    """Compares pandas DataFrames column by column, showing the first differing rows."""
+    if run_1.equals(run_2):
+        return None
+    if not run_1.columns.equals(run_2.columns):
+        return format_differences(
+            "DataFrame columns differ",
+            [("columns", summarize(list(run_1.columns), list(run_2.columns)))],
+        )
+    if not run_1.index.equals(run_2.index):
+        return format_differences(
+            "DataFrame indexes differ",
+            [("index", summarize(list(run_1.index), list(run_2.index)))],
+        )
+    differences: list[tuple[str, str]] = []
+    for position, column in enumerate(run_1.columns):
+        column_1, column_2 = run_1.iloc[:, position], run_2.iloc[:, position]
+        if column_1.equals(column_2):
+            continue
+        not_equal = column_1.ne(column_2) & ~(column_1.isna() & column_2.isna())
+        if not not_equal.any():
+            differences.append(
+                (
+                    f"[{_bounded_repr.repr(column)}].dtype",
+                    summarize(column_1.dtype, column_2.dtype),
+                )
+            )
+        values_1, values_2 = column_1.to_numpy(), column_2.to_numpy()
+        differences.extend(
+            (
+                f"[{_bounded_repr.repr(column)}][{_bounded_repr.repr(column_1.index[row])}]",
+                summarize(values_1.item(row), values_2.item(row)),
+            )
+            for row in not_equal.to_numpy().nonzero()[0][:MAX_DIFFERENCES].tolist()
+        )
+        if len(differences) >= MAX_DIFFERENCES:
+            break
+    return format_differences(f"DataFrames of shape {run_1.shape} differ", differences)
+
+
+BUILTIN_COMPARATORS: dict[type | str, Comparator] = {
+    bytes: compare_bytes,
+    bytearray: compare_bytes,
+    memoryview: compare_bytes,
+    "numpy.ndarray": compare_ndarrays,
+    "pandas.DataFrame": compare_dataframes,
+    "pandas.core.frame.DataFrame": compare_dataframes,  # pandas < 3
+}
+
+
+# ------------------- State Probes -------------------
+
+
+class StateProbe(Protocol):
+    """
+    Snapshots external state after each run of a checked call, e.g. the tables of a
+    database. The idempotency check fails if the second run changed the snapshot.
+    """
+
+    name: str  # what the probe captures, shown in failure messages
+
+    def snapshot(self) -> Any: ...
+
+    def compare(self, before: Any, after: Any) -> str:
+        """Returns a description of the changes, or "" if there are none."""
+        ...
+
+
+class DatabaseProbe:
+    """
+    StateProbe of the row count and an order-independent checksum of each table of
+    a sqlite3 or DB-API connection. Both are computed by a single query for all
+    tables, so rows are not returned to Python.
+
+    Tables and columns of sqlite3 connections are found with one query on
+    sqlite_master and pragma_table_info. SQLite has no hash function, so each row
+    is hashed by get_row_hash, a Python function registered on the connection and
+    called by SQLite once per row. Other connections need the list of tables, and a
+    `row_hash` SQL expression of the `{columns}`, e.g. for PostgreSQL:
+        "('x' || substr(md5(row({columns})::text), 1, 8))::bit(32)::bigint"
+    Their columns are found with an empty SELECT per table. Without a row_hash, only
+    the row counts are compared.
+    """
+
+    name = "database tables"
+
+    def __init__(
+        self,
+        connection: Any,
+        tables: Iterable[str] | None = None,
+        row_hash: str | None = None,
+    ) -> None:
+        self.is_sqlite = is_sqlite = isinstance(connection, sqlite3.Connection)
+        if tables is None and not is_sqlite:
+            raise ValueError("tables are required for non-sqlite3 connections")
+        if row_hash is None and is_sqlite:
+            connection.create_function(
+                SQLITE_ROW_HASH, -1, get_row_hash, deterministic=True
+            )
+            row_hash = f"{SQLITE_ROW_HASH}({{columns}})"
+        self.connection = connection
+        self.tables = None if tables is None else list(tables)
+        self.row_hash = row_hash
+
+    def snapshot(self) -> dict[str, tuple[int, int]]:
+        """Returns the (row count, checksum) of each table."""
+        cursor = self.connection.cursor()
+        try:
+            tables = self.tables
+            columns_by_table: dict[str, list[str]] = {}
+            if self.is_sqlite and (tables is None or (tables and self.row_hash)):
+                columns_by_table = self.get_sqlite_columns(cursor)
+                if tables is None:
+                    tables = list(columns_by_table)
+            if not tables:
+                return {}
+            # Table and column names are quoted, and come from the database itself.
+            queries = []
+            for index, table in enumerate(tables):
+                source = quote_identifier(table)
+                checksum = "0"
+                if self.row_hash is not None:
+                    if table not in columns_by_table:
+                        cursor.execute(f"SELECT * FROM {source} WHERE 1 = 0")  # noqa: S608
+                        columns_by_table[table] = [
+                            column[0] for column in cursor.description
+                        ]
+                    columns = ", ".join(
+                        quote_identifier(column) for column in columns_by_table[table]
+                    )
+                    checksum = self.row_hash.format(columns=columns)
+                    checksum = f"coalesce(sum({checksum}), 0)"
+                queries.append(f"SELECT {index}, count(*), {checksum} FROM {source}")  # noqa: S608
+            cursor.execute(" UNION ALL ".join(queries))
+            return {
+                tables[index]: (count, checksum)
+                for index, count, checksum in cursor.fetchall()
+            }
+        finally:
+            cursor.close()
+
+    def get_sqlite_columns(self, cursor: Any) -> dict[str, list[str]]:
+        """
+        Returns the columns of each table of a sqlite3 connection, or of the given
+        tables, by name.
+        """
+        if self.tables is None:
+            cursor.execute(
+                "SELECT m.name, p.name, p.cid FROM sqlite_master AS m "
+                "JOIN pragma_table_info(m.name) AS p "
+                "WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' "
+                "ORDER BY m.name, p.cid"
+            )
+        else:
+            cursor.execute(
+                " UNION ALL ".join(
+                    ["SELECT ?, name, cid FROM pragma_table_info(?)"] * len(self.tables)
+                ),
+                [name for table in self.tables for name in (table, table)],
+            )
+        columns: dict[str, list[tuple[int, str]]] = {}
+        for table, column, cid in cursor.fetchall():
+            columns.setdefault(table, []).append((cid, column))
+        return {
+            table: [name for _, name in sorted(cids)] for table, cids in columns.items()
+        }
+
+    def compare(
+        self, before: dict[str, tuple[int, int]], after: dict[str, tuple[int, int]]
+    ) -> str:
+        """Returns the tables whose rows changed, or "" if there are none."""
+        changes = []
+        for table in {**before, **after}:
+            if table not in before:
+                changes.append(f"  {table}: table created")
+            elif table not in after:
+                changes.append(f"  {table}: table dropped")
+            elif before[table][0] != after[table][0]:
+                changes.append(
+                    f"  {table}: {before[table][0]} -> {after[table][0]} rows"
+                )
+            elif before[table][1] != after[table][1]:
+                changes.append(f"  {table}: rows changed ({after[table][0]} rows)")
+        return format_changes(changes)
+
+
+def get_row_hash(*values: Any) -> int:
+    """SQL function hashing the values of a row, used by DatabaseProbe for sqlite3."""
+    return zlib.crc32(repr(values).encode())
+
+
+def quote_identifier(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class FileTreeWatcher:
+    """
+    StateProbe of the files under the watched paths. A file's content is only hashed
+    when its (size, mtime_ns, inode) changes, so unchanged trees are cheap to
+    snapshot again.
+    """
+
+    name = "watched files"
+
+    def __init__(self, paths: list[Path]) -> None:
+        self.paths = paths
+        self.digests: dict[str, tuple[tuple[int, int, int], bytes]] = {}
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> dict[str, bytes]:
+        """Returns the content digest of every file under the watched paths."""
+        files: dict[str, bytes] = {}
+        with self.lock:
+            for path in self.paths:
+                if path.is_dir():
+                    self.add_directory(str(path), files)
+                elif path.exists():
+                    self.add_file(str(path), path.stat(), files)
+        return files
+
+    def add_directory(self, directory: str, files: dict[str, bytes]) -> None:
+        stack = [directory]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        self.add_file(
+                            entry.path, entry.stat(follow_symlinks=False), files
+                        )
+
+    def add_file(
+        self, path: str, stat: os.stat_result, files: dict[str, bytes]
+    ) -> None:
+        key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        cached = self.digests.get(path)
+        if cached is None or cached[0] != key:
+            cached = self.digests[path] = (key, get_file_digest(path))
+        files[path] = cached[1]
+
+    def compare(self, before: dict[str, bytes], after: dict[str, bytes]) -> str:
+        """Returns the added, removed and modified files, or "" if there are none."""
+        return format_changes(
+            [
+                *(f"  added: {path}" for path in after if path not in before),
+                *(f"  removed: {path}" for path in before if path not in after),
+                *(
+                    f"  modified: {path}"
+                    for path, digest in after.items()
+                    if path in before and before[path] != digest
+                ),
+            ]
+        )
+
+
+def get_file_digest(path: str) -> bytes:
+    """Hashes the content of a file, or the target of a symbolic link."""
+    file_path = Path(path)
+    digest = hashlib.blake2b()
+    if file_path.is_symlink():
+        digest.update(os.fsencode(os.readlink(file_path)))
+        return digest.digest()
+    with file_path.open("rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def format_changes(changes: list[str]) -> str:
+    """Joins the first changes into a bounded description."""
+    if len(changes) > MAX_DIFFERENCES:
+        more = len(changes) - MAX_DIFFERENCES
+        changes[MAX_DIFFERENCES:] = [f"  ... and {more} more"]
+    return "\n".join(changes)
+
+
+def get_state_probes(item: Function) -> list[StateProbe]:
+    """
+    Returns the StateProbes of a test: the `probes` and `watch_paths` of its marker,
+    and those returned by the pytest_idempotent_probes hook. In the marker, the name
+    of a fixture used by the test, e.g. "tmp_path", is replaced by the fixture's
+    value, relative paths are relative to the rootdir, and DB-API connections are
+    wrapped in a DatabaseProbe.
+    """
+    marker = item.get_closest_marker("idempotent")
+    kwargs = {} if marker is None else marker.kwargs
+    probes = []
+    for probe in kwargs.get("probes", ()):
+        value = get_fixture_value(item, probe)
+        is_connection = callable(getattr(value, "cursor", None))
+        if is_connection and not hasattr(value, "snapshot"):
+            value = DatabaseProbe(value)
+        probes.append(value)
+    watch_paths = kwargs.get("watch_paths", ())
+    if watch_paths:
+        probes.append(
+            FileTreeWatcher(
+                [
+                    item.config.rootpath / get_fixture_value(item, watch_path)
+                    for watch_path in watch_paths
+                ]
+            )
+        )
+    for plugin_probes in item.config.hook.pytest_idempotent_probes(item=item):
+        probes.extend(plugin_probes)
+    return probes
+
+
+def get_fixture_value(item: Function, value: Any) -> Any:
+    """Returns the value of the fixture if value names one used by the test."""
+    return item.funcargs.get(value, value) if isinstance(value, str) else value
+
+
+def check_state(probes: list[StateProbe], snapshots: list[Any]) -> None:
+    """Verifies that the second run did not change the snapshots of the probes."""
+    for probe, before in zip(probes, snapshots):
+        changes = probe.compare(before, probe.snapshot())
+        if changes:
+            raise StateChanged(STATE_CHANGED.format(probe.name, changes))
 
 
 # ------------------- User-facing imports -------------------
@@ -109,7 +1254,15 @@ def idempotent(
     *,
     equal_return: bool = False,
     raises_exception: type[Exception] | None = None,
-    enforce_tests: bool | None = None,
+    enforce_tests: bool | str | None = None,
+    check_once_per_args: bool | None = None,
+    sample_rate: float | None = None,
+    concurrent: int | None = None,
+    max_second_run_ratio: float | None = None,
+    check_memory: bool | None = None,
+    check_args: bool | None = None,
+    isolation: str | None = None,
+    nested: str | None = None,
 ) -> Callable[[_F], _F]: ...  # pragma: no cover
 
 
@@ -117,7 +1270,16 @@ def idempotent(
     func: _F | None = None,
     equal_return: bool = False,
     raises_exception: type[Exception] | None = None,
-    enforce_tests: bool | None = None,
+    enforce_tests: bool | str | None = None,
+    *,
+    check_once_per_args: bool | None = None,
+    sample_rate: float | None = None,
+    concurrent: int | None = None,
+    max_second_run_ratio: float | None = None,
+    check_memory: bool | None = None,
+    check_args: bool | None = None,
+    isolation: str | None = None,
+    nested: str | None = None,
 ) -> Any:  # pragma: no cover
     """
     No-op during runtime. This marker allows Pytest to override the decorated function
@@ -131,9 +1293,49 @@ def idempotent(
 
     Use `enforce_tests=True` to override the global config or to ensure all tests with
     this function called use @pytest.mark.idempotent. Use `enforce_tests=False` to
-    disable this feature.
+    disable this feature. Use `enforce_tests="auto"` to record the tests without the
+    marker that call this function, and mark them automatically in later sessions.
+
+    Use `check_once_per_args=True` to only run the idempotency check once per test
+    for each distinct set of hashable arguments. Defaults to the
+    `idempotent_check_once_per_args` ini setting.
+
+    Use `sample_rate=0.1` to only run the idempotency check for a deterministic,
+    seeded sample of 10% of the calls. Defaults to the `idempotent_sample_rate`
+    ini setting.
+
+    Use `concurrent=4` to run the checked calls as 4 concurrent invocations instead
+    of 2 sequential ones, from a thread pool or as asyncio tasks. This can also be
+    set for a test using @pytest.mark.idempotent(concurrent=4).
+
+    Use `max_second_run_ratio=0.5` to fail the check when the second run takes
+    longer than half of the first run, e.g. when a retry redoes all the work instead
+    of short-circuiting. Second runs faster than the
+    `idempotent_second_run_min_duration` ini setting always pass. Defaults to the
+    `idempotent_max_second_run_ratio` ini setting.
+
+    Use `check_memory=True` to trace the memory allocated by the second run with
+    tracemalloc, and fail the check when it retains more than the
+    `idempotent_memory_threshold` ini setting, e.g. when every call grows a cache.
+    Tracing slows down the second run, so it cannot be combined with
+    `max_second_run_ratio`, and the durations of traced second runs are reported
+    as 0. Defaults to the `idempotent_check_memory` ini setting.
+
+    Use `check_args=True` to fail the check when the second run mutates the
+    arguments, by comparing structural fingerprints of the arguments after each run.
+    Defaults to the `idempotent_check_args` ini setting.
+
+    Use `isolation="fork"` to run the second run in a forked child process, so that
+    its changes to the memory of the test process (globals, caches, singletons) are
+    discarded. Requires os.fork. Defaults to the `idempotent_isolation` ini setting.
+
+    By default, calls made while another @idempotent call is being checked are only
+    run once, so nested functions are not run 2^depth times. Use `nested="all"` to
+    also check these calls. Defaults to the `idempotent_nested` ini setting.
     """
-    del equal_return, raises_exception, enforce_tests
+    del equal_return, raises_exception, enforce_tests, check_once_per_args
+    del sample_rate, concurrent, max_second_run_ratio, check_memory, check_args
+    del isolation, nested
 
     @wraps(cast("_F", func))
     def _idempotent_inner(user_func: _F) -> _F:
@@ -148,22 +1350,186 @@ def idempotent(
 @pytest.fixture(autouse=True)
 def add_idempotency_check(request: SubRequest) -> Iterator[None]:
     """
-    This fixture is added to all tests, but only patches GlobalState.should_run_twice
-    if this fixture is parametrized by the pytest_generate_tests metafunc.
+    This fixture is added to all tests, but only sets TestState.should_run_twice
+    if this fixture is parametrized by the pytest_generate_tests metafunc, or if
+    inline mode is enabled and the test has the @pytest.mark.idempotent marker.
+    It is unset once the test is done, so the teardown of wider-scoped fixtures
+    runs @idempotent functions once.
     """
+    state = get_test_state()
     if hasattr(request, "param"):
-        with patch("pytest_idempotent.GlobalState.should_run_twice", request.param):
-            yield
-    else:
-        yield
+        state.should_run_twice = request.param
+    elif is_inline_mode(request.config) and is_idempotent_marker_enabled(request.node):
+        state.should_run_twice = True
+    yield
+    state.should_run_twice = False
+
+
+def pytest_addoption(parser: Parser) -> None:
+    group = parser.getgroup("idempotent", "idempotency checks")
+    group.addoption(
+        "--idempotent-inline",
+        action="store_true",
+        default=None,
+        help=(
+            "Run each @pytest.mark.idempotent test once, calling every "
+            "@idempotent function twice, instead of collecting two variants."
+        ),
+    )
+    group.addoption(
+        "--idempotent-incremental",
+        action="store_true",
+        default=None,
+        help=(
+            "Only generate the idempotency checks of tests whose source, or the "
+            "source of an @idempotent function they reached, changed since their "
+            "last passing check."
+        ),
+    )
+    group.addoption(
+        "--idempotent-static-analysis",
+        action="store_true",
+        default=None,
+        help=(
+            "Only duplicate @pytest.mark.idempotent tests that statically reach "
+            "an @idempotent function."
+        ),
+    )
+    parser.addini(
+        "idempotent_inline",
+        type="bool",
+        default=False,
+        help="Default value of --idempotent-inline.",
+    )
+    parser.addini(
+        "idempotent_check_once_per_args",
+        type="bool",
+        default=False,
+        help=(
+            "Default value of @idempotent(check_once_per_args=...): only check "
+            "each distinct set of hashable arguments once per test."
+        ),
+    )
+    parser.addini(
+        "idempotent_max_second_run_ratio",
+        default="",
+        help=(
+            "Default value of @idempotent(max_second_run_ratio=...): the maximum "
+            "duration of the second run, as a fraction of the first run."
+        ),
+    )
+    parser.addini(
+        "idempotent_second_run_min_duration",
+        default="0.001",
+        help=(
+            "Second runs faster than this many seconds are never reported by "
+            "max_second_run_ratio."
+        ),
+    )
+    parser.addini(
+        "idempotent_check_args",
+        type="bool",
+        default=False,
+        help=(
+            "Default value of @idempotent(check_args=...): fail when the second "
+            "run mutates the arguments."
+        ),
+    )
+    parser.addini(
+        "idempotent_check_memory",
+        type="bool",
+        default=False,
+        help=(
+            "Default value of @idempotent(check_memory=...): fail when the second "
+            "run retains memory."
+        ),
+    )
+    parser.addini(
+        "idempotent_memory_threshold",
+        default="1024",
+        help=(
+            "Bytes that the second run may retain before check_memory fails the "
+            "idempotency check."
+        ),
+    )
+    parser.addini(
+        "idempotent_isolation",
+        default="none",
+        help=(
+            "Default value of @idempotent(isolation=...): 'fork' to run the second "
+            "run in a forked child process, or 'none'."
+        ),
+    )
+    parser.addini(
+        "idempotent_fork_timeout",
+        default="60",
+        help=(
+            "Seconds that the forked child process of isolation='fork' may run "
+            "before it is killed and the idempotency check fails."
+        ),
+    )
+    parser.addini(
+        "idempotent_nested",
+        default="outer",
+        help=(
+            "Default value of @idempotent(nested=...): 'outer' to only check the "
+            "outermost of nested @idempotent calls, or 'all'."
+        ),
+    )
+    parser.addini(
+        "idempotent_sample_rate",
+        default="",
+        help=(
+            "Default value of @idempotent(sample_rate=...): the fraction of calls "
+            "that run the idempotency check."
+        ),
+    )
+    group.addoption(
+        "--idempotent-durations",
+        type=int,
+        default=None,
+        metavar="N",
+        help=(
+            "Time every @idempotent call, and show the N slowest @idempotent "
+            "functions and tests (N=0 for all)."
+        ),
+    )
+    group.addoption(
+        "--idempotent-report",
+        default=None,
+        metavar="path",
+        help="Time every @idempotent call, and write the timings as JSON to path.",
+    )
+    group.addoption(
+        "--idempotent-sample-seed",
+        default=None,
+        help="Seed used to choose which calls are checked when sampling.",
+    )
+    parser.addini(
+        "idempotent_sample_seed",
+        default="0",
+        help="Default value of --idempotent-sample-seed.",
+    )
+    parser.addini(
+        "idempotent_static_analysis",
+        type="bool",
+        default=False,
+        help="Default value of --idempotent-static-analysis.",
+    )
+    parser.addini(
+        "idempotent_incremental",
+        type="bool",
+        default=False,
+        help="Default value of --idempotent-incremental.",
+    )
 
 
 def pytest_configure(config: Config) -> None:
     config.addinivalue_line(
         "markers",
         (
-            "idempotent(enabled=True): mark test function or test class "
-            "to run idempotency tests"
+            "idempotent(enabled=True, concurrent=None, watch_paths=(), probes=()): "
+            "mark test function or test class to run idempotency tests"
         ),
     )
 
@@ -177,12 +1543,50 @@ def pytest_collection(session: pytest.Session) -> None:
     enforce_test_setting = (
         session.config.pluginmanager.hook.pytest_idempotent_enforce_tests()
     )
+    if isinstance(enforce_test_setting, str) and enforce_test_setting != "auto":
+        raise ValueError(
+            "pytest_idempotent_enforce_tests must return a bool or 'auto', "
+            f"got {enforce_test_setting!r}"
+        )
+    check_once_per_args_setting = bool(
+        session.config.getini("idempotent_check_once_per_args")
+    )
+    sample_rate_setting = session.config.getini("idempotent_sample_rate")
+    max_second_run_ratio_setting = session.config.getini(
+        "idempotent_max_second_run_ratio"
+    )
+    second_run_min_ns = int(
+        float(session.config.getini("idempotent_second_run_min_duration")) * 1e9
+    )
+    check_memory_setting = bool(session.config.getini("idempotent_check_memory"))
+    check_args_setting = bool(session.config.getini("idempotent_check_args"))
+    isolation_setting = session.config.getini("idempotent_isolation")
+    nested_setting = session.config.getini("idempotent_nested")
+    comparators = Comparators(
+        reversed(session.config.pluginmanager.hook.pytest_idempotent_comparators())
+    )
+    memory_threshold = int(session.config.getini("idempotent_memory_threshold"))
+    fork_timeout = float(session.config.getini("idempotent_fork_timeout"))
+    _global_state.static_index = (
+        StaticIndex(decorator_path, session.config.rootpath, get_cache(session.config))
+        if get_option(session.config, "idempotent_static_analysis")
+        else None
+    )
 
     def _idempotent(
         func: _F | None = None,
         equal_return: bool = False,
         raises_exception: type[Exception] | None = None,
-        enforce_tests: bool | None = None,
+        enforce_tests: bool | str | None = None,
+        *,
+        check_once_per_args: bool | None = None,
+        sample_rate: float | None = None,
+        concurrent: int | None = None,
+        max_second_run_ratio: float | None = None,
+        check_memory: bool | None = None,
+        check_args: bool | None = None,
+        isolation: str | None = None,
+        nested: str | None = None,
     ) -> Any:
         """
         Adds the `equal_return` parameter.
@@ -193,10 +1597,367 @@ def pytest_collection(session: pytest.Session) -> None:
             @idempotent(equal_return=True)
         """
 
+        # Decide once what happens when a test without the marker calls the function.
+        if isinstance(enforce_tests, str) and enforce_tests != "auto":
+            raise ValueError(
+                f"enforce_tests must be a bool or 'auto', got {enforce_tests!r}"
+            )
+        if enforce_tests == "auto" or (
+            enforce_tests is None and enforce_test_setting == "auto"
+        ):
+            missing_marker_action = "record"
+        elif enforce_tests is None:
+            enforce = enforce_test_setting is None or enforce_test_setting
+            missing_marker_action = "raise" if enforce else "warn"
+        else:
+            missing_marker_action = "raise" if enforce_tests else "ignore"
+        # These checks compare the second run with the first, so they do not apply
+        # to concurrent runs or to generator functions, whose streams are compared
+        # in lockstep: they are rejected when set explicitly, and skipped when set
+        # by ini settings. The same goes for isolation="fork", which is also
+        # rejected for coroutine functions.
+        explicit_fork = isolation == "fork"
+        sequential_checks = [
+            name
+            for name, value in (
+                ("check_args", check_args),
+                ("check_memory", check_memory),
+                ("max_second_run_ratio", max_second_run_ratio),
+                ("isolation='fork'", explicit_fork),
+            )
+            if value
+        ]
+        if concurrent is not None and sequential_checks:
+            raise ValueError(
+                f"{sequential_checks[0]} cannot be combined with concurrent"
+            )
+        # tracemalloc slows down the second run, so check_memory and
+        # max_second_run_ratio exclude each other. When one of them is set by an
+        # ini setting, the other one set explicitly wins, and check_memory is skipped
+        # if both are set by ini settings.
+        if check_memory and max_second_run_ratio is not None:
+            raise ValueError(
+                "check_memory cannot be combined with max_second_run_ratio"
+            )
+        explicit_check_memory = bool(check_memory)
+        if check_once_per_args is None:
+            check_once_per_args = check_once_per_args_setting
+        if sample_rate is None and sample_rate_setting:
+            sample_rate = float(sample_rate_setting)
+        if sample_rate is not None and not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        if sample_rate == 1:
+            sample_rate = None
+        if concurrent is not None and concurrent < 2:
+            raise ValueError(f"concurrent must be at least 2, got {concurrent}")
+        if max_second_run_ratio is None and max_second_run_ratio_setting:
+            max_second_run_ratio = float(max_second_run_ratio_setting)
+        if max_second_run_ratio is not None and max_second_run_ratio <= 0:
+            raise ValueError(
+                f"max_second_run_ratio must be positive, got {max_second_run_ratio}"
+            )
+        if check_memory is None:
+            check_memory = check_memory_setting
+        if check_memory and max_second_run_ratio is not None:
+            if explicit_check_memory:
+                max_second_run_ratio = None
+            else:
+                check_memory = False
+        if check_args is None:
+            check_args = check_args_setting
+        if isolation is None:
+            isolation = isolation_setting
+        if isolation not in ("none", "fork"):
+            raise ValueError(f"isolation must be 'none' or 'fork', got {isolation!r}")
+        if isolation == "fork" and not hasattr(os, "fork"):
+            raise ValueError("isolation='fork' requires os.fork, which is missing")
+        if nested is None:
+            nested = nested_setting
+        if nested not in ("outer", "all"):
+            raise ValueError(f"nested must be 'outer' or 'all', got {nested!r}")
+        check_nested = nested == "all"
+
         @wraps(cast("_F", func))
         def _idempotent_inner(user_func: _F) -> _F:
             """Wrapper function used to handle the decorator with or without args."""
 
+            def is_checked_call(
+                state: TestState, args: tuple[Any, ...], kwargs: dict[str, Any]
+            ) -> bool:
+                """
+                Enforces the @pytest.mark.idempotent marker, and returns True if
+                this call should be run a second time.
+                """
+                state.contains_idempotent_function = True
+                if state.reached_functions is not None:
+                    state.reached_functions.add(user_func)
+                if not state.has_marker:
+                    assert state.item is not None
+                    if missing_marker_action == "record":
+                        # Only test functions can be marked, e.g. not doctests.
+                        if isinstance(state.item, pytest.Function):
+                            record_auto_marked_test(
+                                get_definition_nodeid(state.item), True
+                            )
+                        return False
+                    message = MISSING_PYTEST_MARKER.format(user_func.__qualname__)
+                    if missing_marker_action == "raise":
+                        raise MissingPytestIdempotentMarker(message)
+                    if missing_marker_action == "warn":
+                        warnings.warn(message, stacklevel=3)
+
+                if not state.should_run_twice or (
+                    not check_nested and _checked_call_depth.get()
+                ):
+                    return False
+                # Only calls that are checked are recorded as verified.
+                key = (
+                    get_call_key(user_func, args, kwargs)
+                    if check_once_per_args
+                    else None
+                )
+                if key is not None and is_verified_call(state, key):
+                    return False
+                if sample_rate is not None and not is_sampled_call(
+                    state, user_func, sample_rate
+                ):
+                    return False
+                if key is not None:
+                    add_verified_call(state, key)
+                return True
+
+            def check_second_run(run_1: Any, run_2: Any) -> None:
+                """Verifies the second run when it did not raise an exception."""
+                if equal_return:
+                    difference = comparators.compare(run_1, run_2)
+                    if difference is not None:
+                        raise ReturnValuesNotEqual(
+                            RETURN_VALUES_NOT_EQUAL.format(difference)
+                        )
+                if raises_exception is not None:
+                    raise FailedToRaiseIdempotencyException(
+                        FAILED_TO_RAISE_IDEMPOTENCY_EXCEPTION.format(
+                            raises_exception.__qualname__
+                        )
+                    )
+
+            def check_second_run_duration(run_1_ns: int, run_2_ns: int) -> None:
+                """Verifies that the second run was cheap compared to the first."""
+                assert max_second_run_ratio is not None
+                if (
+                    run_2_ns >= second_run_min_ns
+                    and run_2_ns > max_second_run_ratio * run_1_ns
+                ):
+                    raise SecondRunTooSlow(
+                        SECOND_RUN_TOO_SLOW.format(
+                            max_second_run_ratio,
+                            run_2_ns / 1e6,
+                            run_2_ns / max(run_1_ns, 1),
+                            run_1_ns / 1e6,
+                        )
+                    )
+
+            def check_arguments(
+                fingerprints: list[bytes], args: tuple[Any, ...], kwargs: dict[str, Any]
+            ) -> None:
+                """Verifies that the second run did not mutate the arguments."""
+                mutated = [
+                    name
+                    for name, fingerprint_1, fingerprint_2 in zip(
+                        get_argument_names(user_func, args, kwargs),
+                        fingerprints,
+                        get_argument_fingerprints(args, kwargs),
+                    )
+                    if fingerprint_1 != fingerprint_2
+                ]
+                if mutated:
+                    raise ArgumentsMutated(ARGUMENTS_MUTATED.format(", ".join(mutated)))
+
+            def check_streams(
+                state: TestState,
+                stream_1: Generator[Any, Any, Any],
+                stream_2: Generator[Any, Any, Any] | None,
+            ) -> Generator[Any, Any, Any]:
+                """
+                Delegates to the first stream like `yield from`: its items are yielded
+                to the caller, the values sent and the exceptions thrown by the caller
+                are passed on to it, and its return value is returned. With
+                equal_return, the second stream is advanced in lockstep with the same
+                inputs, and each pair of items and the return values are compared.
+                Otherwise, the second stream is drained once the first is exhausted,
+                and receives the same inputs after the same items. Only one item of
+                each stream is held at a time, and both streams are advanced as a
+                checked call. Without a second stream, the first one is only timed.
+                """
+                checked = stream_2 is not None
+                results: list[Any] = [None, None]  # return values of the streams
+                durations = [0, 0]
+
+                def resume(index: int, value: Any, thrown: BaseException | None) -> Any:
+                    """Resumes a stream, and returns its item or END_OF_STREAM."""
+                    stream = stream_2 if index else stream_1
+                    assert stream is not None
+                    token = (
+                        _checked_call_depth.set(_checked_call_depth.get() + 1)
+                        if checked
+                        else None
+                    )
+                    start = perf_counter_ns() if state.timings is not None else 0
+                    try:
+                        if thrown is not None:
+                            return stream.throw(thrown)
+                        return stream.send(value)
+                    except StopIteration as stop:
+                        results[index] = stop.value
+                        return END_OF_STREAM
+                    finally:
+                        if state.timings is not None:
+                            durations[index] += perf_counter_ns() - start
+                        if token is not None:
+                            _checked_call_depth.reset(token)
+
+                raised = False  # the second stream raised raises_exception
+                lockstep = equal_return and checked
+                # Inputs other than None, after the number of items yielded before
+                inputs: deque[tuple[int, Any, BaseException | None]] = deque()
+                num_items = 0
+                value: Any = None
+                thrown: BaseException | None = None
+                try:
+                    while True:
+                        item_1 = resume(0, value, thrown)
+                        if lockstep and not raised:
+                            try:
+                                item_2 = resume(1, value, thrown)
+                            except Exception as exc:
+                                if raises_exception is None or not isinstance(
+                                    exc, raises_exception
+                                ):
+                                    raise
+                                raised = True
+                            else:
+                                check_stream_items(num_items, item_1, item_2)
+                        elif (
+                            checked
+                            and not lockstep
+                            and (value is not None or thrown is not None)
+                        ):
+                            inputs.append((num_items, value, thrown))
+                        if item_1 is END_OF_STREAM:
+                            break
+                        num_items += 1
+                        value = thrown = None
+                        try:
+                            value = yield item_1
+                        except GeneratorExit:
+                            raise
+                        except BaseException as exc:  # noqa: BLE001
+                            thrown = exc
+                    if checked and not raised and not lockstep:
+                        try:
+                            drain_stream(inputs, resume)
+                        except Exception as exc:
+                            if raises_exception is None or not isinstance(
+                                exc, raises_exception
+                            ):
+                                raise
+                            raised = True
+                    if lockstep and not raised:
+                        difference = comparators.compare(results[0], results[1])
+                        if difference is not None:
+                            raise ReturnValuesNotEqual(
+                                RETURN_VALUES_NOT_EQUAL.format(difference)
+                            )
+                    if checked and raises_exception is not None and not raised:
+                        raise FailedToRaiseIdempotencyException(
+                            FAILED_TO_RAISE_IDEMPOTENCY_EXCEPTION.format(
+                                raises_exception.__qualname__
+                            )
+                        )
+                    return results[0]
+                finally:
+                    try:
+                        stream_1.close()
+                    finally:
+                        if stream_2 is not None:
+                            stream_2.close()
+                        if state.timings is not None:
+                            record_call(
+                                state,
+                                user_func,
+                                durations[0],
+                                durations[1] if checked else None,
+                            )
+
+            def check_stream_items(index: int, item_1: Any, item_2: Any) -> None:
+                """Compares the items of both streams at the same index."""
+                if item_1 is END_OF_STREAM and item_2 is END_OF_STREAM:
+                    return
+                if item_1 is END_OF_STREAM:
+                    difference: str | None = (
+                        f"<end of stream> != {_bounded_repr.repr(item_2)}"
+                    )
+                elif item_2 is END_OF_STREAM:
+                    difference = f"{_bounded_repr.repr(item_1)} != <end of stream>"
+                else:
+                    difference = comparators.compare(item_1, item_2)
+                if difference is not None:
+                    raise ReturnValuesNotEqual(
+                        STREAM_ITEMS_NOT_EQUAL.format(index, difference)
+                    )
+
+            def get_concurrent_runs(state: TestState) -> int | None:
+                """
+                Returns the number of concurrent runs of a checked call, or None to
+                run it twice in sequence. Raises ValueError if the test's marker sets
+                fewer than 2 concurrent runs, concurrent runs for a function with
+                sequential checks, or probes for concurrent runs.
+                """
+                if state.concurrent is not None and state.concurrent < 2:
+                    raise ValueError(
+                        f"concurrent must be at least 2, got {state.concurrent}"
+                    )
+                num_runs = concurrent or state.concurrent
+                if num_runs and sequential_checks:
+                    raise ValueError(
+                        f"{sequential_checks[0]} cannot be combined with concurrent"
+                    )
+                if num_runs and state.marker_probes:
+                    raise ValueError(
+                        "probes and watch_paths cannot be combined with concurrent"
+                    )
+                return num_runs
+
+            def check_concurrent_runs(outcomes: list[_Outcome]) -> Any:
+                """
+                Verifies the outcomes of concurrent runs, and returns the result of
+                the first successful run. With raises_exception, only one run may
+                succeed, and all others must raise the expected exception.
+                """
+                errors = [exc for _, exc in outcomes if exc is not None]
+                for exc in errors:
+                    if raises_exception is None or not isinstance(
+                        exc, raises_exception
+                    ):
+                        raise exc
+                results = [result for result, exc in outcomes if exc is None]
+                if not results:
+                    raise errors[0]
+                if equal_return:
+                    for result in results[1:]:
+                        difference = comparators.compare(results[0], result)
+                        if difference is not None:
+                            raise ReturnValuesNotEqual(
+                                RETURN_VALUES_NOT_EQUAL.format(difference)
+                            )
+                if raises_exception is not None and len(results) > 1:
+                    raise FailedToRaiseIdempotencyException(
+                        CONCURRENT_RUNS_DID_NOT_RAISE.format(
+                            raises_exception.__qualname__, len(results), len(outcomes)
+                        )
+                    )
+                return results[0]
+
             def run_twice(*args: Any, **kwargs: Any) -> Any:
                 """
                 This function contains the new behavior of @idempotent.
@@ -208,39 +1969,219 @@ def pytest_collection(session: pytest.Session) -> None:
                 e.g. a function that returns True if updated and False otherwise
                     is acceptably idempotent, unless equal_return = True.
                 """
-                _global_state.contains_idempotent_function = True
-                assert _global_state.current_test is not None
-                if _global_state.current_test.get_closest_marker("idempotent") is None:
-                    message = MISSING_PYTEST_MARKER.format(user_func.__qualname__)
-                    if enforce_tests is None:
-                        if enforce_test_setting is None or enforce_test_setting:
-                            raise MissingPytestIdempotentMarker(message)
-                        warnings.warn(message, stacklevel=2)
-                    elif enforce_tests:
-                        raise MissingPytestIdempotentMarker(message)
-
-                run_1 = user_func(*args, **kwargs)
-                if _global_state.should_run_twice:
+                state = get_test_state()
+                if not is_checked_call(state, args, kwargs):
+                    if state.timings is None:
+                        return user_func(*args, **kwargs)
+                    start = perf_counter_ns()
+                    run_1 = user_func(*args, **kwargs)
+                    record_call(state, user_func, perf_counter_ns() - start, None)
+                    return run_1
+                token = _checked_call_depth.set(_checked_call_depth.get() + 1)
+                try:
+                    measure = (
+                        state.timings is not None or max_second_run_ratio is not None
+                    )
+                    start = end_1 = perf_counter_ns() if measure else 0
+                    num_runs = get_concurrent_runs(state)
+                    if num_runs:
+                        try:
+                            return check_concurrent_runs(
+                                run_concurrently(user_func, args, kwargs, num_runs)
+                            )
+                        finally:
+                            if state.timings is not None:
+                                record_call(
+                                    state, user_func, 0, perf_counter_ns() - start
+                                )
+                    run_1 = user_func(*args, **kwargs)
+                    if measure:
+                        end_1 = perf_counter_ns()
+                    if isolation == "fork":
+                        run_in_child_process(
+                            state,
+                            user_func,
+                            lambda: check_second_call(
+                                state, run_1, end_1 - start, args, kwargs
+                            ),
+                            fork_timeout,
+                        )
+                    else:
+                        check_second_call(state, run_1, end_1 - start, args, kwargs)
+                    return run_1
+                finally:
+                    _checked_call_depth.reset(token)
+
+            def check_second_call(
+                state: TestState,
+                run_1: Any,
+                run_1_ns: int,
+                args: tuple[Any, ...],
+                kwargs: dict[str, Any],
+            ) -> None:
+                """
+                Runs the provided function a second time after run 1, and verifies
+                the second run. Called in a child process with isolation="fork".
+                """
+                with checked_second_run(state, run_1, run_1_ns, args, kwargs) as run_2:
+                    run_2.append(user_func(*args, **kwargs))
+
+            @contextmanager
+            def checked_second_run(
+                state: TestState,
+                run_1: Any,
+                run_1_ns: int,
+                args: tuple[Any, ...],
+                kwargs: dict[str, Any],
+            ) -> Iterator[list[Any]]:
+                """
+                Verifies the second run of a checked call, which the with block runs
+                and appends to the yielded list. Used by both the sync and the async
+                wrappers. An expected raises_exception is suppressed.
+                """
+                measure = state.timings is not None or max_second_run_ratio is not None
+                fingerprints = (
+                    get_argument_fingerprints(args, kwargs) if check_args else None
+                )
+                probes = state.probes
+                snapshots = [probe.snapshot() for probe in probes] if probes else None
+                memory_trace = MemoryTrace() if check_memory else None
+                run_2: list[Any] = []
+                start_2 = end_2 = perf_counter_ns() if measure else 0
+                try:
                     try:
-                        run_2 = user_func(*args, **kwargs)
+                        yield run_2
                     except Exception as exc:
-                        if raises_exception is not None and isinstance(
+                        if raises_exception is None or not isinstance(
                             exc, raises_exception
                         ):
-                            return run_1
-                        raise
-                    if equal_return and run_1 != run_2:
-                        raise ReturnValuesNotEqual(
-                            RETURN_VALUES_NOT_EQUAL.format(run_1, run_2)
-                        )
-                    if raises_exception is not None:
-                        raise FailedToRaiseIdempotencyException(
-                            FAILED_TO_RAISE_IDEMPOTENCY_EXCEPTION.format(
-                                raises_exception.__qualname__
+                            raise
+                        raised = True
+                    else:
+                        raised = False
+                    finally:
+                        if measure:
+                            end_2 = perf_counter_ns()
+                        if state.timings is not None:
+                            # Traced second runs are slower, so they are not timed.
+                            record_call(
+                                state,
+                                user_func,
+                                run_1_ns,
+                                0 if memory_trace is not None else end_2 - start_2,
+                            )
+                    if not raised:
+                        # The second result is discarded, not retained.
+                        check_second_run(run_1, run_2.pop())
+                    if fingerprints is not None:
+                        check_arguments(fingerprints, args, kwargs)
+                    if snapshots is not None:
+                        check_state(probes, snapshots)
+                    if raised:
+                        return
+                    if max_second_run_ratio is not None:
+                        check_second_run_duration(run_1_ns, end_2 - start_2)
+                    if memory_trace is not None:
+                        memory_trace.check(memory_threshold)
+                finally:
+                    if memory_trace is not None:
+                        memory_trace.stop()
+
+            async def run_twice_async(*args: Any, **kwargs: Any) -> Any:
+                """
+                Same as run_twice, for coroutine functions. Both runs are awaited
+                one after the other on the running event loop.
+                """
+                state = get_test_state()
+                if not is_checked_call(state, args, kwargs):
+                    if state.timings is None:
+                        return await user_func(*args, **kwargs)
+                    start = perf_counter_ns()
+                    run_1 = await user_func(*args, **kwargs)
+                    record_call(state, user_func, perf_counter_ns() - start, None)
+                    return run_1
+                token = _checked_call_depth.set(_checked_call_depth.get() + 1)
+                try:
+                    return await run_checked_call_async(state, args, kwargs)
+                finally:
+                    _checked_call_depth.reset(token)
+
+            async def run_checked_call_async(
+                state: TestState, args: tuple[Any, ...], kwargs: dict[str, Any]
+            ) -> Any:
+                """Runs and verifies both runs of a checked call of run_twice_async."""
+                measure = state.timings is not None or max_second_run_ratio is not None
+                start = end_1 = perf_counter_ns() if measure else 0
+                num_runs = get_concurrent_runs(state)
+                if num_runs:
+                    try:
+                        return check_concurrent_runs(
+                            await run_concurrently_async(
+                                user_func, args, kwargs, num_runs
                             )
                         )
+                    finally:
+                        if state.timings is not None:
+                            record_call(state, user_func, 0, perf_counter_ns() - start)
+                run_1 = await user_func(*args, **kwargs)
+                if measure:
+                    end_1 = perf_counter_ns()
+                with checked_second_run(
+                    state, run_1, end_1 - start, args, kwargs
+                ) as run_2:
+                    run_2.append(await user_func(*args, **kwargs))
                 return run_1
 
+            def run_twice_generator(*args: Any, **kwargs: Any) -> Any:
+                """
+                Same as run_twice, for generator functions. Both generators are created
+                right away, and check_streams runs the second one as the first one is
+                consumed, so streams are never materialized.
+                """
+                state = get_test_state()
+                if not is_checked_call(state, args, kwargs):
+                    if state.timings is None:
+                        return user_func(*args, **kwargs)
+                    return check_streams(state, user_func(*args, **kwargs), None)
+                if state.marker_probes:
+                    raise ValueError(
+                        "probes and watch_paths are not supported for generator "
+                        f"functions, got {user_func.__qualname__}"
+                    )
+                if state.concurrent is not None:
+                    raise ValueError(
+                        "concurrent is not supported for generator functions, "
+                        f"got {user_func.__qualname__}"
+                    )
+                return check_streams(
+                    state, user_func(*args, **kwargs), user_func(*args, **kwargs)
+                )
+
+            if explicit_fork and (
+                inspect.iscoroutinefunction(user_func)
+                or inspect.isgeneratorfunction(user_func)
+            ):
+                raise ValueError(
+                    "isolation='fork' is not supported for coroutine or generator "
+                    f"functions, got {user_func.__qualname__}"
+                )
+            generator_checks = [
+                *sequential_checks,
+                *(["concurrent"] if concurrent is not None else []),
+            ]
+            if generator_checks and inspect.isgeneratorfunction(user_func):
+                raise ValueError(
+                    f"{generator_checks[0]} is not supported for generator functions, "
+                    f"got {user_func.__qualname__}"
+                )
+            if _global_state.checked_definitions is not None:
+                _global_state.idempotent_functions[get_function_name(user_func)] = (
+                    user_func
+                )
+            if inspect.iscoroutinefunction(user_func):
+                return cast("_F", run_twice_async)
+            if inspect.isgeneratorfunction(user_func):
+                return cast("_F", run_twice_generator)
             return cast("_F", run_twice)
 
         return _idempotent_inner if func is None else _idempotent_inner(func)
@@ -260,8 +2201,36 @@ def pytest_generate_tests(metafunc: Metafunc) -> None:
     @pytest.mark.idempotent
     @pytest.mark.idempotent(enabled=True)
     @pytest.mark.idempotent(enabled=False)
+
+    In inline mode, the test is not duplicated. Instead, the single test run
+    performs the idempotency check by calling each @idempotent function twice.
+
+    With static analysis enabled, tests that cannot reach an @idempotent function
+    are not duplicated.
+
+    In incremental mode, tests that are unchanged since their last passing check
+    only get the NO_IDEMPOTENCY_ID test.
+
+    Tests recorded by the "auto" enforcement mode are treated as marked.
     """
-    if is_idempotent_marker_enabled(metafunc.definition):
+    static_index = _global_state.static_index
+    if (
+        (
+            is_idempotent_marker_enabled(metafunc.definition)
+            or is_auto_marked_test(metafunc.definition, metafunc.definition.nodeid)
+        )
+        and not is_inline_mode(metafunc.config)
+        and (static_index is None or static_index.test_reaches(metafunc))
+    ):
+        if is_unchanged_test(metafunc):
+            _global_state.unchanged_tests += 1
+            metafunc.parametrize(
+                "add_idempotency_check",
+                (False,),
+                indirect=True,
+                ids=(NO_IDEMPOTENCY_ID,),
+            )
+            return
         metafunc.parametrize(
             "add_idempotency_check",
             (False, True),
@@ -270,42 +2239,413 @@ def pytest_generate_tests(metafunc: Metafunc) -> None:
         )
 
 
+def pytest_sessionstart(session: pytest.Session) -> None:
+    _global_state.sample_seed = str(
+        get_option(session.config, "idempotent_sample_seed")
+    )
+    _global_state.sampled_calls = [0, 0]
+    _global_state.timing_records = (
+        []
+        if session.config.getoption("idempotent_durations") is not None
+        or session.config.getoption("idempotent_report") is not None
+        else None
+    )
+    _global_state.checked_definitions = (
+        {}
+        if get_option(session.config, "idempotent_incremental")
+        and get_cache(session.config) is not None
+        and not is_inline_mode(session.config)
+        else None
+    )
+    _global_state.idempotent_functions = {}
+    _global_state.check_variants = {}
+    _global_state.unchanged_tests = 0
+    cache = get_cache(session.config)
+    _global_state.auto_marked_tests = frozenset(
+        () if cache is None else cache.get(AUTO_MARKED_TESTS_CACHE_KEY, ())
+    )
+    _global_state.recorded_tests = {}
+    _global_state.first_runs = {}
+    _global_state.buffered_first_runs = 0
+    _global_state.cached_first_runs = None
+    _global_state.first_run_files = None
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_pycollect_makeitem(
+    collector: Any, name: str, obj: Any
+) -> Generator[None, Any, None]:
+    """
+    In incremental mode, remembers the CHECK_IDEMPOTENCY_ID tests generated for each
+    test function. Unlike pytest_itemcollected, this also sees the parametrized
+    tests that are not selected by their nodeid.
+    """
+    del collector, name, obj
+    outcome = yield
+    if _global_state.checked_definitions is None or outcome.excinfo is not None:
+        return
+    items = outcome.get_result()
+    for item in items if isinstance(items, list) else ():
+        if (
+            isinstance(item, pytest.Function)
+            and hasattr(item, "callspec")
+            and item.callspec.params.get("add_idempotency_check")
+        ):
+            _global_state.check_variants.setdefault(
+                get_definition_nodeid(item), set()
+            ).add(item.callspec.id)
+
+
+def pytest_itemcollected(item: pytest.Item) -> None:
+    """
+    Adds @pytest.mark.idempotent to the tests recorded by the "auto" mode.
+
+    With `--dist loadgroup`, puts both tests of each idempotency pair in the same
+    xdist_group, unless the test already has one, so that they run on the same
+    worker. Workers only know the mode through the loadgroup option set by xdist.
+    This runs before xdist adds the group to nodeids.
+    """
+    if not isinstance(item, pytest.Function):
+        return
+    if _global_state.auto_marked_tests and is_auto_marked_test(
+        item, get_definition_nodeid(item)
+    ):
+        item.add_marker(pytest.mark.idempotent)
+        item.stash[AUTO_MARKED_KEY] = True
+    if (
+        hasattr(item.config, "workerinput")
+        and item.config.getvalue("loadgroup")
+        and hasattr(item, "callspec")
+        and "add_idempotency_check" in item.callspec.params
+        and item.get_closest_marker("xdist_group") is None
+    ):
+        digest = hashlib.sha256(get_first_run_key(item).encode()).hexdigest()
+        item.add_marker(pytest.mark.xdist_group(f"idempotency_{digest[:12]}"))
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(items: list[pytest.Item]) -> None:
+    """
+    Link the tests of each idempotency pair through their stash, so that later
+    hooks never parse nodeids. Keep the order chosen by the user or other plugins
+    (e.g. random ordering), but move each CHECK_IDEMPOTENCY_ID test directly after
+    its paired NO_IDEMPOTENCY_ID test, so it can reuse the first run's result.
+    """
+    regular_items: dict[str, Function] = {}
+    check_items: list[Function] = []
+    for item in items:
+        if not isinstance(item, pytest.Function) or not hasattr(item, "callspec"):
+            continue
+        param = item.callspec.params.get("add_idempotency_check")
+        if param is None:
+            continue
+        is_check_test = item.stash[IS_CHECK_TEST_KEY] = bool(param)
+        if is_check_test:
+            check_items.append(item)
+        else:
+            regular_items.setdefault(item.nodeid, item)
+    # Tests whose paired NO_IDEMPOTENCY_ID test was deselected, or already paired
+    # with a duplicate of the test (e.g. with --keep-duplicates), keep their position.
+    moved_items = set()
+    for check_item in check_items:
+        regular_item = regular_items.get(get_pair_nodeid(check_item))
+        if regular_item is not None and CHECK_TEST_KEY not in regular_item.stash:
+            regular_item.stash[CHECK_TEST_KEY] = check_item
+            moved_items.add(id(check_item))
+    if not moved_items:
+        return
+    ordered_items = []
+    for item in items:
+        if id(item) in moved_items:
+            continue
+        ordered_items.append(item)
+        paired_item = item.stash.get(CHECK_TEST_KEY, None)
+        if paired_item is not None:
+            ordered_items.append(paired_item)
+    items[:] = ordered_items
+
+
+def pytest_collection_finish(session: pytest.Session) -> None:
+    del session
+    if _global_state.static_index is not None:
+        _global_state.static_index.save()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_setup(item: Function) -> None:
+    """
+    Before the fixtures are set up, create the TestState of the test
+    and bind it to the current context.
+    """
+    state = TestState(item)
+    _global_state.test_state = state
+    item.stash[TEST_STATE_TOKEN_KEY] = _test_state.set(state)
+
+
 def pytest_runtest_call(item: Function) -> None:
     """
-    Before the test begins, update the global state to
-    point to the current test context.
+    Before the test begins, skip the idempotency test if its first run failed,
+    and reset the calls made by fixtures.
     """
-    if is_idempotency_test(item, CHECK_IDEMPOTENCY_ID):
-        first_run_result = _global_state.all_test_runs.get(get_pair_nodeid(item))
+    if item.stash.get(IS_CHECK_TEST_KEY, False):
+        first_run_result = item.stash.get(FIRST_RUN_RESULT_KEY, None)
+        if first_run_result is None:
+            first_run_result = load_first_run(item)
         if first_run_result is None:
             warnings.warn(IDEMPOTENCY_TEST_OUT_OF_ORDER, stacklevel=2)
         elif not first_run_result:
             pytest.skip(SKIPPING_IDEMPOTENCY_CHECK)
 
-    _global_state.current_test = item
-    _global_state.contains_idempotent_function = False
+    state = get_test_state()
+    state.contains_idempotent_function = False
+    if state.should_run_twice:
+        state.probes = get_state_probes(item)
 
 
-def pytest_runtest_teardown(item: Function, nextitem: Function | None) -> None:
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(
+    item: Function, nextitem: Function | None
+) -> Generator[None, None, None]:
     """
     Warns if the finished test has the @pytest.mark.idempotent marker
     but did not call any function with the @idempotent decorator. This discourages
     users from running many tests twice unecessarily (the second is skipped).
+    The warning is emitted once per pair of tests, by the first one that ran.
+
+    After the fixtures are torn down, unbinds the TestState from the context,
+    and releases the first run's result stored on a CHECK_IDEMPOTENCY_ID test.
     """
     del nextitem
-    if not _global_state.contains_idempotent_function and is_idempotency_test(
-        item, CHECK_IDEMPOTENCY_ID
+    state = get_test_state()
+    is_check_test = item.stash.get(IS_CHECK_TEST_KEY, None)
+    if (
+        not state.contains_idempotent_function
+        and not item.stash.get(AUTO_MARKED_KEY, False)
+        and (
+            is_check_test is False
+            or (is_check_test and FIRST_RUN_RESULT_KEY not in item.stash)
+            or (is_check_test is None and is_inline_idempotency_test(item))
+        )
     ):
         warnings.warn(MISSING_IDEMPOTENT_FUNCTION, stacklevel=2)
+    elif (
+        state.contains_idempotent_function
+        and is_check_test is None
+        and _global_state.static_index is not None
+        and is_idempotent_marker_enabled(item)
+        and not is_inline_idempotency_test(item)
+    ):
+        warnings.warn(STATIC_ANALYSIS_MISSED_FUNCTION, stacklevel=2)
+    if is_check_test and FIRST_RUN_RESULT_KEY in item.stash:
+        del item.stash[FIRST_RUN_RESULT_KEY]
+    yield
+    if state.timings and _global_state.timing_records is not None:
+        _global_state.timing_records.extend(
+            TimingRecord(
+                item.nodeid,
+                get_function_name(user_func),
+                *timing,
+            )
+            for user_func, timing in state.timings.items()
+        )
+    state.finished = True
+    token = item.stash.get(TEST_STATE_TOKEN_KEY, None)
+    if token is not None:
+        _test_state.reset(token)
+        del item.stash[TEST_STATE_TOKEN_KEY]
 
 
 def pytest_runtest_makereport(item: Function, call: CallInfo[None]) -> None:
-    """If a NO_IDEMPOTENCY_ID test passes, add the result to all_test_runs."""
-    if call.when == "call" and is_idempotency_test(item, NO_IDEMPOTENCY_ID):
+    """
+    When a NO_IDEMPOTENCY_ID test has run, store its result on the paired
+    CHECK_IDEMPOTENCY_ID test. The result is also buffered, and written to the pytest
+    cache at the end of the session, to be reused by sessions that only run the
+    CHECK_IDEMPOTENCY_ID tests, e.g. with `-k check_idempotency` or `--lf`.
+
+    In incremental mode, when a CHECK_IDEMPOTENCY_ID test has run, record the
+    @idempotent functions it reached, or that its test function must be checked
+    again if it failed.
+
+    When a test marked by the "auto" enforcement mode has passed, record whether it
+    still calls an @idempotent function.
+    """
+    if (
+        call.when == "call"
+        and not call.excinfo
+        and item.stash.get(AUTO_MARKED_KEY, False)
+        and not item.stash.get(IS_CHECK_TEST_KEY, False)
+    ):
+        record_auto_marked_test(
+            get_definition_nodeid(item),
+            get_test_state().contains_idempotent_function,
+        )
+    if (
+        call.when == "call"
+        and _global_state.checked_definitions is not None
+        and item.stash.get(IS_CHECK_TEST_KEY, False)
+    ):
+        record_checked_test(item, call)
+    if call.when == "call" and item.stash.get(IS_CHECK_TEST_KEY, None) is False:
         # Store test result, or False if @idempotent function is missing.
-        _global_state.all_test_runs[item.nodeid] = (
-            not call.excinfo if _global_state.contains_idempotent_function else False
+        result = (
+            not call.excinfo if get_test_state().contains_idempotent_function else False
+        )
+        check_item = item.stash.get(CHECK_TEST_KEY, None)
+        if check_item is not None:
+            check_item.stash[FIRST_RUN_RESULT_KEY] = result
+        cache = get_cache(item.config)
+        source_hash = None if cache is None else get_source_hash(item)
+        if cache is not None and source_hash is not None:
+            merge_first_run(
+                _global_state.first_runs,
+                get_definition_nodeid(item),
+                {"source_hash": source_hash, "results": {item.callspec.id: result}},
+            )
+            _global_state.buffered_first_runs += 1
+            if _global_state.buffered_first_runs >= FIRST_RUNS_FLUSH_SIZE:
+                save_first_runs(cache)
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    """
+    Writes the remaining first runs to the pytest cache. On pytest-xdist workers,
+    send the sampling counts, timings, incremental results and recorded tests to the
+    controller. Otherwise, write the timings to the --idempotent-report file, prune
+    the first runs of removed test files, and write the incremental results and
+    recorded tests to the pytest cache.
+    """
+    cache = get_cache(session.config)
+    if cache is not None:
+        save_first_runs(cache)
+    workeroutput = getattr(session.config, "workeroutput", None)
+    if workeroutput is not None:
+        # execnet only serializes builtin types, so each TimingRecord is sent as a
+        # tuple, and rebuilt by pytest_testnodedown.
+        timing_records = _global_state.timing_records
+        output: dict[str, Any] = {
+            "sampled_calls": _global_state.sampled_calls,
+            "timing_records": None
+            if timing_records is None
+            else [tuple(record) for record in timing_records],
+            "checked_definitions": _global_state.checked_definitions,
+            "check_variants": {
+                nodeid: list(variants)
+                for nodeid, variants in _global_state.check_variants.items()
+            },
+            "unchanged_tests": _global_state.unchanged_tests,
+            "recorded_tests": _global_state.recorded_tests,
+        }
+        workeroutput["pytest_idempotent"] = output
+        return
+    if cache is not None:
+        prune_first_runs(session.config, cache)
+    if cache is not None and _global_state.checked_definitions:
+        save_checked_definitions(
+            cache, _global_state.checked_definitions, _global_state.check_variants
+        )
+    if cache is not None and _global_state.recorded_tests:
+        save_auto_marked_tests(cache, _global_state.recorded_tests)
+    report_path = session.config.getoption("idempotent_report")
+    if report_path is not None and _global_state.timing_records is not None:
+        with Path(report_path).open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "timings": [
+                        record._asdict() for record in _global_state.timing_records
+                    ]
+                },
+                f,
+                indent=2,
+            )
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node: Any, error: Any) -> None:
+    """
+    Merges the sampling counts, timings, incremental results and recorded tests of
+    a finished pytest-xdist worker. Every worker collects all
+    tests, so the unchanged tests are counted once.
+    """
+    del error
+    output = getattr(node, "workeroutput", {}).get("pytest_idempotent")
+    if output is None:
+        return
+    for i, count in enumerate(output["sampled_calls"]):
+        _global_state.sampled_calls[i] += count
+    if output["timing_records"] and _global_state.timing_records is not None:
+        _global_state.timing_records.extend(
+            TimingRecord(*record) for record in output["timing_records"]
+        )
+    if output["checked_definitions"] and _global_state.checked_definitions is not None:
+        for nodeid, reached in output["checked_definitions"].items():
+            merge_checked_definition(nodeid, reached)
+    for nodeid, variants in output["check_variants"].items():
+        _global_state.check_variants.setdefault(nodeid, set()).update(variants)
+    _global_state.unchanged_tests = max(
+        _global_state.unchanged_tests, output["unchanged_tests"]
+    )
+    for nodeid, called in output["recorded_tests"].items():
+        record_auto_marked_test(nodeid, called)
+
+
+def pytest_terminal_summary(terminalreporter: TerminalReporter) -> None:
+    """
+    Reports how many calls to sampled @idempotent functions were checked, how many
+    unchanged tests were not checked in incremental mode, which tests the "auto"
+    enforcement mode recorded, and the slowest @idempotent functions and tests if
+    --idempotent-durations is used.
+    """
+    checked, skipped = _global_state.sampled_calls
+    if checked or skipped:
+        terminalreporter.write_sep("=", "idempotency sampling")
+        terminalreporter.write_line(
+            f"{checked} of {checked + skipped} calls to sampled @idempotent "
+            f"functions were checked, {skipped} were skipped "
+            f"(seed: {_global_state.sample_seed})."
         )
+    if _global_state.unchanged_tests:
+        terminalreporter.write_sep("=", "incremental idempotency checks")
+        terminalreporter.write_line(
+            f"Skipped the idempotency checks of {_global_state.unchanged_tests} "
+            "unchanged tests."
+        )
+    recorded = [
+        nodeid
+        for nodeid, called in _global_state.recorded_tests.items()
+        if called and nodeid not in _global_state.auto_marked_tests
+    ]
+    forgotten = [
+        nodeid for nodeid, called in _global_state.recorded_tests.items() if not called
+    ]
+    if recorded or forgotten:
+        terminalreporter.write_sep("=", "automatic idempotency markers")
+        for nodeid in recorded:
+            terminalreporter.write_line(f"marked {nodeid}")
+        for nodeid in forgotten:
+            terminalreporter.write_line(f"unmarked {nodeid}")
+
+    durations = terminalreporter.config.getoption("idempotent_durations")
+    records = _global_state.timing_records
+    if durations is None or records is None:
+        return
+    for title, key in (("functions", "function"), ("tests", "nodeid")):
+        totals: dict[str, list[int]] = {}
+        for record in records:
+            total = totals.setdefault(getattr(record, key), [0, 0, 0, 0])
+            total[0] += record.calls
+            total[1] += record.checked_calls
+            total[2] += record.run_1_ns
+            total[3] += record.run_2_ns
+        slowest = sorted(totals.items(), key=lambda item: -item[1][3])
+        header = f"slowest {durations} " if durations > 0 else "all "
+        terminalreporter.write_sep("=", f"{header}idempotency checks by {title}")
+        for name, (calls, checked_calls, run_1_ns, run_2_ns) in (
+            slowest[:durations] if durations > 0 else slowest
+        ):
+            terminalreporter.write_line(
+                f"{run_2_ns / 1e6:.3f}ms run 2  {run_1_ns / 1e6:.3f}ms run 1  "
+                f"{checked_calls}/{calls} calls checked  {name}"
+            )
 
 
 class PytestIdempotentSpec:
@@ -320,13 +2660,34 @@ class PytestIdempotentSpec:
         return ""  # This value is never used.
 
     @pytest.hookspec(firstresult=True)
-    def pytest_idempotent_enforce_tests(self) -> bool | None:
+    def pytest_idempotent_enforce_tests(self) -> bool | str | None:
         """
         Plugin users define this function in conftest.py to enforce all tests
         with an @idempotent function use the @pytest.mark.idempotent marker.
+        Return "auto" to record these tests instead, and mark them automatically
+        in later sessions.
         """
         return None  # This value is never used.
 
+    @pytest.hookspec
+    def pytest_idempotent_comparators(self) -> Mapping[type | str, Comparator]:
+        """
+        Plugin users define this function in conftest.py to register comparators
+        for @idempotent(equal_return=True), keyed by type or by "module.QualName".
+        A comparator returns None if two return values are equal, or else a short
+        description of their differences. These override the built-in comparators.
+        """
+        return {}  # This value is never used.
+
+    @pytest.hookspec
+    def pytest_idempotent_probes(self, item: Function) -> Iterable[StateProbe]:
+        """
+        Plugin users define this function in conftest.py to add StateProbes to the
+        idempotency checks of a test, e.g. a DatabaseProbe of its connection.
+        """
+        del item
+        return []  # This value is never used.
+
 
 def pytest_addhooks(pluginmanager: PytestPluginManager) -> None:
     pluginmanager.add_hookspecs(PytestIdempotentSpec)
@@ -343,16 +2704,776 @@ def is_idempotent_marker_enabled(item: Function) -> bool:
     )
 
 
-def is_idempotency_test(item: Function, test_id: str) -> bool:
+def get_call_key(
+    user_func: Callable[..., Any], args: tuple[Any, ...], kwargs: dict[str, Any]
+) -> Hashable | None:
+    """
+    Returns the key of a call in TestState.verified_calls, or None if the arguments
+    are unhashable. Arguments of different types are distinct, even if they are
+    equal, e.g. 1, True and 1.0.
+    """
+    key = (
+        user_func,
+        args,
+        tuple(map(type, args)),
+        tuple(kwargs.items()),
+        tuple(map(type, kwargs.values())),
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def is_verified_call(state: TestState, key: Hashable) -> bool:
+    """Returns True if the call was already checked in the current test."""
+    verified_calls = state.verified_calls
+    with state.lock:
+        if key in verified_calls:
+            verified_calls.move_to_end(key)
+            return True
+    return False
+
+
+def add_verified_call(state: TestState, key: Hashable) -> None:
+    """Records a checked call, evicting the least recently checked call if full."""
+    verified_calls = state.verified_calls
+    with state.lock:
+        verified_calls[key] = None
+        if len(verified_calls) > VERIFIED_CALLS_MAXSIZE:
+            verified_calls.popitem(last=False)
+
+
+def is_sampled_call(
+    state: TestState, user_func: Callable[..., Any], sample_rate: float
+) -> bool:
+    """
+    Returns True if this call should run the idempotency check. The choice only
+    depends on the seed, the test, the function and the number of previous calls,
+    so failures can be reproduced with the same --idempotent-sample-seed.
+    """
+    assert state.item is not None
+    with state.lock:
+        sampler = state.samplers.get(user_func)
+        if sampler is None:
+            sampler = state.samplers[user_func] = random.Random(
+                f"{_global_state.sample_seed}:{state.item.nodeid}:"
+                f"{user_func.__module__}.{user_func.__qualname__}"
+            )
+        is_sampled = sampler.random() < sample_rate
+        _global_state.sampled_calls[0 if is_sampled else 1] += 1
+    return is_sampled
+
+
+def record_call(
+    state: TestState, user_func: Callable[..., Any], run_1_ns: int, run_2_ns: int | None
+) -> None:
+    """Adds the durations of a call to the timings of the current test."""
+    assert state.timings is not None
+    with state.lock:
+        timing = state.timings.get(user_func)
+        if timing is None:
+            timing = state.timings[user_func] = [0, 0, 0, 0]
+        timing[0] += 1
+        timing[2] += run_1_ns
+        if run_2_ns is not None:
+            timing[1] += 1
+            timing[3] += run_2_ns
+
+
+def run_in_child_process(
+    state: TestState,
+    user_func: Callable[..., Any],
+    func: Callable[[], None],
+    timeout: float,
+) -> None:
+    """
+    Calls func in a forked child process, so that its changes to the memory of this
+    process are discarded, and re-raises the exception it raised, if any. The child
+    pickles the exception, its traceback and the timing of the call into a pipe, and
+    exits without running any cleanup of this process. A child that runs for more
+    than timeout seconds, e.g. because it deadlocked on a lock held by another
+    thread of this process, is killed.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover (child process)
+        os.close(read_fd)
+        status = 1
+        try:
+            if state.timings is not None:
+                state.timings = {}
+            exc_data = tb = None
+            try:
+                func()
+            except BaseException as exc:  # noqa: BLE001
+                tb = "".join(
+                    traceback.format_exception(type(exc), exc, exc.__traceback__)
+                )
+                try:
+                    exc_data = pickle.dumps(exc, pickle.HIGHEST_PROTOCOL)
+                except Exception:  # noqa: BLE001
+                    exc_data = None
+            timing = None if state.timings is None else state.timings.get(user_func)
+            with os.fdopen(write_fd, "wb") as pipe:
+                pickle.dump((exc_data, tb, timing), pipe, pickle.HIGHEST_PROTOCOL)
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    try:
+        payload = read_until_eof(read_fd, time.monotonic() + timeout)
+    except TimeoutError:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        raise ForkedRunFailed(CHILD_TIMED_OUT.format(timeout)) from None
+    finally:
+        os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    if not payload:
+        raise ForkedRunFailed(
+            CHILD_EXITED_WITHOUT_OUTCOME.format(
+                os.WEXITSTATUS(status) if os.WIFEXITED(status) else status
+            )
+        )
+    exc_data, tb, timing = pickle.loads(payload)  # noqa: S301
+    if timing is not None and state.timings is not None:
+        with state.lock:
+            total = state.timings.setdefault(user_func, [0, 0, 0, 0])
+            total[:] = [a + b for a, b in zip(total, timing)]
+    if tb is None:
+        return
+    cause = ForkedRunFailed(SECOND_RUN_RAISED_IN_CHILD.format(tb))
+    try:
+        error = pickle.loads(exc_data) if exc_data is not None else None  # noqa: S301
+    except Exception:  # noqa: BLE001
+        error = None  # e.g. the exception's __init__ takes other arguments
+    if not isinstance(error, BaseException):
+        raise cause
+    raise error from cause
+
+
+def read_until_eof(fd: int, deadline: float) -> bytes:
+    """Reads a pipe until EOF, or raises TimeoutError at the time.monotonic deadline."""
+    chunks: list[bytes] = []
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            raise TimeoutError
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def get_fingerprint(value: Any) -> bytes:
+    """
+    Returns a structural digest of the value, which changes when the value is
+    mutated. Mappings, sequences, sets and objects with a __dict__ or __slots__ are
+    encoded recursively, with the type of each value, and hashed with BLAKE2b.
+    Builtin containers of short immutable values are encoded by chunked reprs, and
+    bytes and buffers such as bytearrays and NumPy arrays are hashed in place.
+    Nothing is copied, except the buffers that are not contiguous, and chunks of
+    the reprs of containers and of the UTF-8 encoding of strings.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    update_fingerprint(digest, value, set())
+    return digest.digest()
+
+
+def are_short_atoms(values: Collection[Any]) -> bool:
+    """
+    Returns True if the values are atomic, and strings or bytes of at most
+    MAX_REPR_ITEM_LENGTH, so that the repr of their container is their encoding.
+    """
+    types = set(map(type, values))
+    if not types <= ATOMIC_TYPES:
+        return False
+    if str not in types and bytes not in types:
+        return True
+    if not types <= {str, bytes}:
+        values = [value for value in values if type(value) in (str, bytes)]
+    return max(map(len, values)) <= MAX_REPR_ITEM_LENGTH
+
+
+def update_fingerprint(digest: hashlib.blake2b, value: Any, seen: set[int]) -> None:
+    """Adds the type-tagged encoding of the value to the digest."""
+    cls: type = type(value)
+    digest.update(f"{cls.__module__}.{cls.__qualname__}\0".encode())
+    if isinstance(value, bytes):
+        digest.update(b"%d\0" % len(value))
+        digest.update(value)
+        return
+    if isinstance(value, str):
+        digest.update(b"%d\0" % len(value))
+        for start in range(0, len(value), STRING_CHUNK_SIZE):
+            chunk = value[start : start + STRING_CHUNK_SIZE]
+            digest.update(chunk.encode("utf-8", "surrogatepass"))
+        return
+    if cls in ATOMIC_TYPES or isinstance(value, (int, float, complex)):
+        digest.update(f"{value!r}\0".encode())
+        return
+    if id(value) in seen:
+        digest.update(b"<seen>\0")  # shared reference, or reference cycle
+        return
+    seen.add(id(value))
+    if (
+        (cls is list or cls is tuple or (cls is set and len(value) <= REPR_CHUNK_SIZE))
+        and are_short_atoms(value)
+    ) or (cls is dict and are_short_atoms(value) and are_short_atoms(value.values())):
+        digest.update(b"%d\0" % len(value))
+        if cls is set:
+            digest.update(f"{sorted(map(repr, value))!r}\0".encode())
+            return
+        items = iter(value.items() if cls is dict else value)
+        for batch in iter(lambda: list(islice(items, REPR_CHUNK_SIZE)), []):
+            digest.update(f"{batch!r}\0".encode())
+        return
+    if isinstance(value, Mapping):
+        digest.update(b"%d\0" % len(value))
+        for key, item in value.items():
+            update_fingerprint(digest, key, seen)
+            update_fingerprint(digest, item, seen)
+        return
+    if isinstance(value, AbstractSet):
+        # Sets have no order, so their items are encoded by the sum of their digests.
+        total = 0
+        for item in value:
+            item_digest = hashlib.blake2b(digest_size=16)
+            update_fingerprint(item_digest, item, seen)
+            total += int.from_bytes(item_digest.digest(), "big")
+        digest.update(b"%d\0" % len(value))
+        digest.update((total % (1 << 128)).to_bytes(16, "big"))
+        return
+    if cls is not list and cls is not tuple:
+        try:
+            view = memoryview(value)
+        except (TypeError, ValueError):
+            pass
+        else:
+            digest.update(f"{view.format}{view.shape}\0".encode())
+            if view.format == "O":
+                # Buffers of objects hold pointers, so their items are encoded.
+                for item in getattr(value, "flat", ()):
+                    update_fingerprint(digest, item, seen)
+                return
+            if not view.c_contiguous:
+                view = memoryview(view.tobytes())
+            digest.update(view.cast("B"))
+            return
+    if isinstance(value, Sequence):
+        digest.update(b"%d\0" % len(value))
+        for item in value:
+            update_fingerprint(digest, item, seen)
+        return
+    attributes = getattr(value, "__dict__", None)
+    slots = get_slot_names(cls)
+    if attributes is not None or slots:
+        if attributes is not None:
+            update_fingerprint(digest, attributes, seen)
+        for name in slots:
+            digest.update(f"{name}\0".encode())
+            if hasattr(value, name):
+                update_fingerprint(digest, getattr(value, name), seen)
+        return
+    if getattr(cls, "__hash__", None) not in (None, object.__hash__):
+        # Values that define their own hash are immutable, e.g. datetimes.
+        digest.update(f"{value!r}\0".encode())
+        return
+    warnings.warn(ARGUMENT_NOT_FINGERPRINTED.format(cls.__qualname__), stacklevel=2)
+
+
+@lru_cache(maxsize=None)
+def get_slot_names(cls: type) -> tuple[str, ...]:
+    """Returns the attribute names of the __slots__ of the class and its bases."""
+    names = []
+    for base in cls.__mro__:
+        slots = base.__dict__.get("__slots__", ())
+        for name in [slots] if isinstance(slots, str) else slots:
+            if name in ("__dict__", "__weakref__"):
+                continue
+            private = name.startswith("__") and not name.endswith("__")
+            names.append(f"_{base.__name__.lstrip('_')}{name}" if private else name)
+    return tuple(names)
+
+
+def get_argument_fingerprints(
+    args: tuple[Any, ...], kwargs: dict[str, Any]
+) -> list[bytes]:
+    """Returns the fingerprints of the positional and keyword arguments, in order."""
+    return [get_fingerprint(value) for value in (*args, *kwargs.values())]
+
+
+def get_argument_names(
+    user_func: Callable[..., Any], args: tuple[Any, ...], kwargs: dict[str, Any]
+) -> list[str]:
+    """Returns the names of the positional and keyword arguments, in order."""
+    try:
+        parameters = inspect.signature(user_func).parameters.values()
+    except (TypeError, ValueError):
+        positional_names = []
+    else:
+        positional_names = [
+            parameter.name
+            for parameter in parameters
+            if parameter.kind
+            in {
+                inspect.Parameter.POSITIONAL_ONLY,
+                inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            }
+        ]
+    return [
+        positional_names[index] if index < len(positional_names) else f"args[{index}]"
+        for index in range(len(args))
+    ] + list(kwargs)
+
+
+class MemoryTrace:
+    """
+    Traces the memory allocated from its creation, e.g. by the second run of a
+    checked call. tracemalloc is only started for the duration of the trace, unless
+    it was already tracing, so unchecked calls do not pay for the tracing overhead.
+    """
+
+    def __init__(self) -> None:
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.snapshot = take_memory_snapshot()
+
+    def check(self, threshold: int) -> None:
+        """Raises SecondRunRetainedMemory if more than threshold bytes are retained."""
+        stats = take_memory_snapshot().compare_to(self.snapshot, "lineno")
+        retained = sum(stat.size_diff for stat in stats)
+        if retained > threshold:
+            top_lines = [stat for stat in stats if stat.size_diff > 0]
+            raise SecondRunRetainedMemory(
+                SECOND_RUN_RETAINED_MEMORY.format(
+                    retained,
+                    threshold,
+                    "\n".join(f"  {stat}" for stat in top_lines[:MEMORY_TOP_LINES]),
+                )
+            )
+
+    def stop(self) -> None:
+        if self.started:
+            tracemalloc.stop()
+            self.started = False
+
+
+def take_memory_snapshot() -> tracemalloc.Snapshot:
+    """Returns a snapshot of the memory still reachable, without our own frames."""
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces(MEMORY_TRACE_FILTERS)
+
+
+def drain_stream(
+    inputs: deque[tuple[int, Any, BaseException | None]],
+    resume: Callable[[int, Any, BaseException | None], Any],
+) -> None:
+    """
+    Exhausts the second stream of a checked call, sending it the inputs that the
+    first stream received after the same number of items, and None otherwise.
+    """
+    num_items = 0
+    while True:
+        value: Any = None
+        thrown: BaseException | None = None
+        if inputs and inputs[0][0] == num_items:
+            _, value, thrown = inputs.popleft()
+        if resume(1, value, thrown) is END_OF_STREAM:
+            return
+        num_items += 1
+
+
+def run_concurrently(
+    user_func: Callable[..., Any],
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    num_runs: int,
+) -> list[_Outcome]:
+    """
+    Runs the function in num_runs threads, which all start behind a barrier. Each
+    thread runs in a copy of the current context.
+    """
+    barrier = threading.Barrier(num_runs)
+
+    def invoke() -> _Outcome:
+        barrier.wait()
+        try:
+            return user_func(*args, **kwargs), None
+        except Exception as exc:  # noqa: BLE001
+            return None, exc
+
+    with ThreadPoolExecutor(max_workers=num_runs) as executor:
+        futures = [executor.submit(copy_context().run, invoke) for _ in range(num_runs)]
+    return [future.result() for future in futures]
+
+
+async def run_concurrently_async(
+    user_func: Callable[..., Any],
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    num_runs: int,
+) -> list[_Outcome]:
+    """Runs the coroutine function as num_runs tasks, which all start together."""
+    ready = asyncio.Event()
+    num_waiting = 0
+
+    async def invoke() -> _Outcome:
+        nonlocal num_waiting
+        num_waiting += 1
+        if num_waiting == num_runs:
+            ready.set()
+        await ready.wait()
+        try:
+            return await user_func(*args, **kwargs), None
+        except Exception as exc:  # noqa: BLE001
+            return None, exc
+
+    return list(await asyncio.gather(*(invoke() for _ in range(num_runs))))
+
+
+def is_inline_mode(config: Config) -> bool:
+    """Returns True if idempotency checks run inline, without duplicating tests."""
+    return bool(get_option(config, "idempotent_inline"))
+
+
+def is_inline_idempotency_test(item: Function) -> bool:
+    """Returns True if the test item runs its idempotency check inline."""
+    return is_inline_mode(item.config) and is_idempotent_marker_enabled(item)
+
+
+def get_option(config: Config, name: str) -> Any:
+    """
+    Returns the command line value of the given option if it was passed,
+    otherwise the value of the ini setting with the same name.
+    """
+    value = config.getoption(name, None)
+    return config.getini(name) if value is None else value
+
+
+def get_cache(config: Config) -> Cache | None:
+    """Returns the pytest cache, or None if the cacheprovider plugin is disabled."""
+    return cast("Cache | None", getattr(config, "cache", None))
+
+
+def load_first_run(item: Function) -> bool | None:
     """
-    Returns True if the test item has the @pytest.mark.idempotent marker
-    enabled and matches the given test_id.
+    Returns the result of the NO_IDEMPOTENCY_ID test paired with the given test,
+    from this session or a previous one, or None if it was never stored or the test
+    source has changed since.
     """
-    return is_idempotent_marker_enabled(item) and test_id in item.callspec.id
+    cache = get_cache(item.config)
+    if cache is None:
+        return None
+    nodeid = get_definition_nodeid(item)
+    first_run = _global_state.first_runs.get(nodeid)
+    if first_run is None:
+        # Tests of the same file usually run together, so only the FirstRuns of the
+        # last loaded file are kept in memory.
+        path = nodeid.split("::", 1)[0]
+        cached = _global_state.cached_first_runs
+        if cached is None or cached[0] != path:
+            cached = (path, load_cached_first_runs(cache, path))
+            _global_state.cached_first_runs = cached
+        first_run = cached[1].get(nodeid)
+    source_hash = get_source_hash(item)
+    if (
+        not isinstance(first_run, dict)
+        or source_hash is None
+        or first_run.get("source_hash") != source_hash
+    ):
+        return None
+    callspec_id = item.callspec.id.replace(CHECK_IDEMPOTENCY_ID, NO_IDEMPOTENCY_ID)
+    result = first_run.get("results", {}).get(callspec_id)
+    return None if result is None else bool(result)
+
+
+def merge_first_run(
+    first_runs: dict[str, FirstRun], nodeid: str, first_run: FirstRun
+) -> None:
+    """
+    Merges the FirstRun of a test function into first_runs. The results of an older
+    source of the test function are discarded.
+    """
+    merged = first_runs.get(nodeid)
+    if (
+        not isinstance(merged, dict)
+        or merged.get("source_hash") != first_run["source_hash"]
+        or not isinstance(merged.get("results"), dict)
+    ):
+        first_runs[nodeid] = {
+            "source_hash": first_run["source_hash"],
+            "results": dict(first_run["results"]),
+        }
+    else:
+        merged["results"].update(first_run["results"])
+
+
+def get_first_runs_cache_key(path: str) -> str:
+    """Returns the pytest cache key of the FirstRuns of a test file."""
+    return FIRST_RUNS_CACHE_KEY.format(hashlib.sha256(path.encode()).hexdigest())
+
+
+def load_cached_first_runs(cache: Cache, path: str) -> dict[str, FirstRun]:
+    """Returns the cached FirstRuns of a test file, by nodeid."""
+    cached = cache.get(get_first_runs_cache_key(path), {})
+    if not isinstance(cached, dict):
+        return {}
+    return {
+        nodeid: cast("FirstRun", run)
+        for nodeid, run in cached.items()
+        if isinstance(run, dict) and isinstance(run.get("results"), dict)
+    }
+
+
+def load_first_run_files(cache: Cache) -> set[str]:
+    """Returns the test files with cached FirstRuns."""
+    if _global_state.first_run_files is None:
+        cached = cache.get(FIRST_RUN_FILES_CACHE_KEY, [])
+        _global_state.first_run_files = set(cached if isinstance(cached, list) else ())
+    return _global_state.first_run_files
+
+
+def save_first_runs(cache: Cache) -> None:
+    """
+    Merges the buffered FirstRuns into the pytest cache, with one key per test
+    file, so that a session that crashes keeps the results it already wrote.
+    pytest-xdist workers write their own results, and a result lost to concurrent
+    writes only makes its idempotency test run again.
+    """
+    by_path: dict[str, dict[str, FirstRun]] = {}
+    for nodeid, first_run in _global_state.first_runs.items():
+        by_path.setdefault(nodeid.split("::", 1)[0], {})[nodeid] = first_run
+    _global_state.first_runs = {}
+    _global_state.buffered_first_runs = 0
+    for path, first_runs in by_path.items():
+        cached = load_cached_first_runs(cache, path)
+        merged: dict[str, FirstRun] = {
+            nodeid: cast("FirstRun", {**run, "results": dict(run["results"])})
+            for nodeid, run in cached.items()
+        }
+        for nodeid, first_run in first_runs.items():
+            merge_first_run(merged, nodeid, first_run)
+        if merged != cached:
+            cache.set(get_first_runs_cache_key(path), merged)
+        _global_state.cached_first_runs = (path, merged)
+    files = load_first_run_files(cache)
+    if not files.issuperset(by_path):
+        files.update(by_path)
+        cache.set(FIRST_RUN_FILES_CACHE_KEY, sorted(files))
+
+
+def prune_first_runs(config: Config, cache: Cache) -> None:
+    """
+    Removes the cached FirstRuns of test files that were removed. Other tests are
+    kept, since sessions that select tests (e.g. by nodeid, -k or --lf) do not tell
+    which tests still exist.
+    """
+    files = load_first_run_files(cache)
+    removed = {path for path in files if not (config.rootpath / path).exists()}
+    if removed:
+        for path in removed:
+            cache.set(get_first_runs_cache_key(path), {})
+        files -= removed
+        cache.set(FIRST_RUN_FILES_CACHE_KEY, sorted(files))
+
+
+def get_first_run_key(item: Function) -> str:
+    """
+    Returns the nodeid of the NO_IDEMPOTENCY_ID test paired with the given test,
+    without any suffix that other plugins append, e.g. "@group" from pytest-xdist.
+    """
+    assert item.parent is not None
+    callspec_id = item.callspec.id.replace(CHECK_IDEMPOTENCY_ID, NO_IDEMPOTENCY_ID)
+    return f"{item.parent.nodeid}::{item.originalname}[{callspec_id}]"
+
+
+def is_unchanged_test(metafunc: Metafunc) -> bool:
+    """
+    In incremental mode, returns True if the test function and every @idempotent
+    function it reached are unchanged since each of its idempotency checks passed.
+    """
+    if _global_state.checked_definitions is None:
+        return False
+    cache = get_cache(metafunc.config)
+    assert cache is not None
+    cached = cache.get(
+        get_reached_functions_cache_key(metafunc.definition.nodeid), None
+    )
+    return (
+        isinstance(cached, dict)
+        and bool(cached.get("functions"))
+        and cached.get("source_hash") == get_function_source_hash(metafunc.function)
+        and bool(cached.get("variants"))
+        and set(cached.get("passed", ())).issuperset(cached["variants"])
+        and are_functions_unchanged(cached["functions"])
+    )
+
+
+def are_functions_unchanged(functions: dict[str, str | None]) -> bool:
+    """Returns True if the @idempotent functions still have these source hashes."""
+    for name, source_hash in functions.items():
+        func = _global_state.idempotent_functions.get(name)
+        if (
+            func is None
+            or source_hash is None
+            or get_function_source_hash(func) != source_hash
+        ):
+            return False
+    return True
+
+
+def record_checked_test(item: Function, call: CallInfo[None]) -> None:
+    """Records the @idempotent functions reached by a finished idempotency check."""
+    nodeid = get_definition_nodeid(item)
+    if call.excinfo is not None:
+        if not call.excinfo.errisinstance(pytest.skip.Exception):
+            merge_checked_definition(nodeid, None)
+        return
+    source_hash = get_source_hash(item)
+    reached_functions = get_test_state().reached_functions
+    if source_hash is None or reached_functions is None:
+        return
+    merge_checked_definition(
+        nodeid,
+        {
+            "source_hash": source_hash,
+            "functions": {
+                get_function_name(func): get_function_source_hash(func)
+                for func in reached_functions
+            },
+            "passed": [item.callspec.id],
+            "variants": [],
+        },
+    )
+
+
+def merge_checked_definition(nodeid: str, reached: ReachedFunctions | None) -> None:
+    """Merges the ReachedFunctions of a test, where None means a check failed."""
+    checked_definitions = _global_state.checked_definitions
+    assert checked_definitions is not None
+    if nodeid not in checked_definitions or reached is None:
+        checked_definitions[nodeid] = reached
+        return
+    merged = checked_definitions[nodeid]
+    if merged is not None:
+        merged["functions"].update(reached["functions"])
+        merged["passed"].extend(reached["passed"])
+
+
+def save_checked_definitions(
+    cache: Cache,
+    checked_definitions: dict[str, ReachedFunctions | None],
+    check_variants: dict[str, set[str]],
+) -> None:
+    """
+    Writes the incremental results to the pytest cache, with the ids of the
+    collected CHECK_IDEMPOTENCY_ID tests. They are merged with the results of
+    previous sessions for the same sources, which may have run other parametrized
+    tests, e.g. with -k. Failed checks clear the cached results.
+    """
+    for nodeid, reached in checked_definitions.items():
+        key = get_reached_functions_cache_key(nodeid)
+        if reached is None:
+            cache.set(key, {})
+            continue
+        cached = cache.get(key, None)
+        functions = reached["functions"]
+        passed = set(reached["passed"])
+        variants = set(check_variants.get(nodeid, ()))
+        if (
+            isinstance(cached, dict)
+            and cached.get("source_hash") == reached["source_hash"]
+            and are_functions_unchanged(cached.get("functions", {}))
+        ):
+            functions = {**cached.get("functions", {}), **functions}
+            passed.update(cached.get("passed", ()))
+            # Selecting tests by nodeid only collects the selected variants.
+            variants.update(cached.get("variants", ()))
+        result: ReachedFunctions = {
+            "source_hash": reached["source_hash"],
+            "functions": functions,
+            "passed": sorted(passed),
+            "variants": sorted(variants),
+        }
+        cache.set(key, result)
+
+
+def get_reached_functions_cache_key(nodeid: str) -> str:
+    return (
+        f"{REACHED_FUNCTIONS_CACHE_KEY}/{hashlib.sha256(nodeid.encode()).hexdigest()}"
+    )
+
+
+def is_auto_marked_test(node: pytest.Item, nodeid: str) -> bool:
+    """
+    Returns True if the "auto" enforcement mode recorded the test function with the
+    given nodeid, and the test does not have its own @pytest.mark.idempotent marker.
+    """
+    return (
+        nodeid in _global_state.auto_marked_tests
+        and node.get_closest_marker("idempotent") is None
+    )
+
+
+def record_auto_marked_test(nodeid: str, called: bool) -> None:
+    """
+    Records whether a test function called an @idempotent function, in the "auto"
+    enforcement mode. A parametrized test function stays marked if any of its tests
+    called one.
+    """
+    recorded_tests = _global_state.recorded_tests
+    recorded_tests[nodeid] = called or recorded_tests.get(nodeid, False)
+
+
+def save_auto_marked_tests(cache: Cache, recorded_tests: dict[str, bool]) -> None:
+    """Adds or removes the recorded tests from the automatically marked tests."""
+    auto_marked_tests = set(cache.get(AUTO_MARKED_TESTS_CACHE_KEY, ()))
+    for nodeid, called in recorded_tests.items():
+        if called:
+            auto_marked_tests.add(nodeid)
+        else:
+            auto_marked_tests.discard(nodeid)
+    cache.set(AUTO_MARKED_TESTS_CACHE_KEY, sorted(auto_marked_tests))
+
+
+def get_definition_nodeid(item: Function) -> str:
+    """Returns the nodeid of the test function of the test, without parameters."""
+    assert item.parent is not None
+    return f"{item.parent.nodeid}::{item.originalname}"
+
+
+def get_function_name(func: Callable[..., Any]) -> str:
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def get_source_hash(item: Function) -> str | None:
+    """Returns a hash of the test function's source code, if it is available."""
+    return get_function_source_hash(getattr(item.obj, "__func__", item.obj))
+
+
+@lru_cache(maxsize=None)
+def get_function_source_hash(func: Callable[..., Any]) -> str | None:
+    """Same as get_source_hash, computed once for all parametrized tests of func."""
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        return None
+    return hashlib.sha256(source.encode()).hexdigest()
 
 
 def get_pair_nodeid(item: Function) -> str:
+    """
+    Returns the nodeid of the NO_IDEMPOTENCY_ID test paired with the given test,
+    keeping any suffix that other plugins append, e.g. "@group" from pytest-xdist.
+    """
+    start = item.nodeid.index("[")
+    end = start + len(item.callspec.id) + 2
     return (
-        f"{item.nodeid[: item.nodeid.index('[')]}"
+        f"{item.nodeid[:start]}"
         f"[{item.callspec.id.replace(CHECK_IDEMPOTENCY_ID, NO_IDEMPOTENCY_ID)}]"
+        f"{item.nodeid[end:]}"
     )
@@ -1,34 +1,63 @@
+import json
+from pathlib import Path
+from typing import Any
+
 import pytest
 from _pytest.pytester import Pytester
 
-from tests.utils import CONFTEST_MAP, Result
+from pytest_idempotent import _global_state
+from tests.utils import (
+    ARGS_MAP,
+    AUTO_ENFORCE_TESTS_CONFTEST,
+    CONFTEST_MAP,
+    DEFAULT_CONFTEST,
+    Result,
+)
 
 # Maps conftest_type -> test cases
 TEST_MAPPING = {
     "default": (
+        ("test_async", Result(passed=5, failed=1)),
+        ("test_check_args", Result(passed=14, failed=8, warnings=1)),
+        ("test_check_memory", Result(passed=6, failed=2)),
+        ("test_check_once_per_args", Result(passed=6)),
+        ("test_check_once_per_args_setting", Result(passed=1, failed=1)),
         ("test_class", Result(passed=7)),
+        ("test_concurrent", Result(passed=11, failed=5)),
         ("test_correct_behavior", Result(passed=2)),
+        ("test_custom_comparator", Result(passed=1, failed=1)),
         ("test_equal_return_fail", Result(passed=1, failed=1)),
+        ("test_equal_return_comparators", Result(passed=8, failed=4)),
         ("test_equal_return_pass", Result(passed=2)),
         ("test_first_failed_skip_second", Result(skipped=1, failed=1)),
+        ("test_generators", Result(passed=26, failed=6)),
         ("test_first_missing_skip_second", Result(skipped=1, failed=1, warnings=1)),
+        ("test_fixture_teardown", Result(passed=3)),
         ("test_incorrect_but_idempotent", Result(failed=1, skipped=1)),
+        ("test_incremental", Result(passed=7, failed=1)),
+        ("test_isolation", Result(passed=8, failed=4)),
+        ("test_max_second_run_ratio", Result(passed=11, failed=2)),
         ("test_missing_marker_fail", Result(failed=1)),
         ("test_missing_marker_ignore", Result(passed=1)),
         ("test_missing_marker_pass", Result(passed=1)),
         ("test_missing_marker_in_try_except", Result(failed=1)),
-        ("test_nested_idempotent_functions", Result(passed=2)),
+        ("test_nested_idempotent_functions", Result(passed=4)),
         ("test_not_idempotent", Result(passed=1, failed=1)),
         ("test_raises_expected_exception", Result(passed=2)),
         ("test_raises_expected_exception_missing", Result(passed=1, failed=1)),
         ("test_raises_unexpected_exception", Result(passed=1, failed=1)),
+        ("test_sample_rate", Result(passed=4)),
+        ("test_state_probes", Result(passed=7, failed=3)),
+        ("test_threads", Result(passed=5, failed=1)),
         ("test_warn_unnecessary_marker", Result(passed=5, skipped=4, warnings=4)),
+        ("test_watch_paths", Result(passed=6, failed=4)),
     ),
     "custom_decorator": (("test_custom_decorator", Result(passed=1, failed=1)),),
-    # "random_ordering": (
-    #     ("test_class", Result(passed=7, warnings=2)),
-    #     ("test_warn_unnecessary_marker", Result(passed=8, skipped=1, warnings=7)),
-    # ),
+    "random_ordering": (
+        ("test_class", Result(passed=7)),
+        ("test_first_failed_skip_second", Result(skipped=1, failed=1)),
+        ("test_warn_unnecessary_marker", Result(passed=5, skipped=4, warnings=4)),
+    ),
     "enforce": (
         ("test_missing_marker_fail", Result(passed=1, warnings=1)),
         ("test_missing_marker_ignore", Result(passed=1)),
@@ -36,6 +65,136 @@ TEST_MAPPING = {
         ("test_missing_marker_method_override", Result(failed=1)),
         ("test_missing_marker_in_try_except", Result(passed=1, warnings=1)),
     ),
+    "auto_enforce": (
+        ("test_auto_marked", Result(passed=6)),
+        ("test_missing_marker_fail", Result(passed=1)),
+    ),
+    "inline": (
+        ("test_class", Result(passed=4)),
+        ("test_equal_return_fail", Result(failed=1)),
+        ("test_first_missing_skip_second", Result(failed=1, warnings=1)),
+        ("test_nested_idempotent_functions", Result(passed=2)),
+        ("test_not_idempotent", Result(failed=1)),
+        ("test_raises_expected_exception", Result(passed=1)),
+        ("test_warn_unnecessary_marker", Result(passed=5, warnings=4)),
+    ),
+    "static_analysis": (
+        ("test_class", Result(passed=7)),
+        ("test_custom_decorator", Result(passed=1)),
+        ("test_first_missing_skip_second", Result(failed=1)),
+        ("test_static_analysis", Result(passed=7)),
+        ("test_warn_unnecessary_marker", Result(passed=5)),
+    ),
+    "static_analysis_custom_decorator": (
+        ("test_custom_decorator", Result(passed=1, failed=1)),
+    ),
+    "check_once_per_args": (
+        ("test_check_once_per_args_setting", Result(passed=2)),
+        ("test_not_idempotent", Result(passed=1, failed=1)),
+    ),
+    "max_second_run_ratio": (
+        ("test_concurrent", Result(passed=11, failed=5)),
+        ("test_correct_behavior", Result(passed=2)),
+        ("test_max_second_run_ratio", Result(passed=10, failed=3)),
+    ),
+    "probes": (("test_state_probes", Result(passed=6, failed=4)),),
+    "comparators": (
+        ("test_custom_comparator", Result(passed=2)),
+        ("test_equal_return_fail", Result(passed=1, failed=1)),
+    ),
+    "nested": (("test_nested_idempotent_functions", Result(passed=3, failed=1)),),
+    "sample_seed": (("test_check_once_per_args", Result(passed=6)),),
+    "isolation": (
+        ("test_async", Result(passed=5, failed=1)),
+        ("test_concurrent", Result(passed=11, failed=5)),
+        ("test_generators", Result(passed=26, failed=6)),
+    ),
+}
+# Maps test file -> (-k expression, lines expected in the failure messages)
+FAILURE_MESSAGES = {
+    "test_check_args": (
+        "check_idempotency",
+        (
+            "E *ArgumentsMutated: * the second run mutated these arguments: x",
+            "E *ArgumentsMutated: * mutated these arguments: order, audit",
+            "E *ArgumentsMutated: * mutated these arguments: rows",
+            "E *ArgumentsMutated: * mutated these arguments: visits, audit",
+            "E *ArgumentsMutated: * mutated these arguments: counter",
+            "E *ArgumentsMutated: * mutated these arguments: lines",
+            "E *ArgumentsMutated: * mutated these arguments: ids, archived",
+        ),
+    ),
+    "test_check_memory": (
+        "test_leaky_register",
+        (
+            "E   *SecondRunRetainedMemory: * the second run retained * bytes, *",
+            "E *Top allocating lines:",
+            "E *test_check_memory.py:15: size=97.7 KiB (+97.7 KiB), count=2 (+2)*",
+        ),
+    ),
+    "test_concurrent": (
+        "concurrent_marker",
+        (
+            "E *ValueError: check_args cannot be combined with concurrent",
+            "E *ValueError: probes and watch_paths cannot be combined with concurrent",
+            "E *ValueError: concurrent must be at least 2, got 1",
+        ),
+    ),
+    "test_equal_return_comparators": (
+        "different",
+        (
+            "E *ReturnValuesNotEqual: * must be equal: b'\\x00\\x00*' != b'*'",
+            "E *First differences: ?500001:?: b'\\x01\\x00*' != b'\\x00\\x01*'",
+            "E *ReturnValuesNotEqual: * equal: [[]0, 0, 0, 0, 0, 0, ...[]] != *",
+            "E *First differences: len: 1001 != 1002",
+            "E *ReturnValuesNotEqual: * must be equal: {'a': 1, 'calls': 1} != *",
+            "E *First differences: ?'calls'?: 1 != 2",
+            "E *First differences: ?'kkkk*...*kkk1'?: 1 != <missing>, *",
+        ),
+    ),
+    "test_generators": (
+        "check_idempotency",
+        (
+            "E *ReturnValuesNotEqual: * but item 0 differs: 1 != 2",
+            "E *ReturnValuesNotEqual: * item 0 differs: 1 != <end of stream>",
+            "E *ValueError: probes and watch_paths are not supported for generator *",
+            "E *ValueError: concurrent is not supported for generator functions, *",
+        ),
+    ),
+    "test_isolation": (
+        "check_idempotency",
+        (
+            "*ForkedRunFailed: The second run raised in the forked child process:",
+            "*, in process_once",
+            "E *ValueError: key was already processed",
+            "E *ArgumentsMutated: * the second run mutated these arguments: x",
+            "E *ForkedRunFailed: * exited with status 3 without reporting its outcome.",
+        ),
+    ),
+    "test_max_second_run_ratio": (
+        "test_redo",
+        ("E   *SecondRunTooSlow: * second run took *ms, which is *x the first *ms.",),
+    ),
+    "test_state_probes": (
+        "check_idempotency",
+        (
+            "E *StateChanged: The second run changed the database tables:",
+            "E *  audit: 1 -> 2 rows",
+            "E *  orders: rows changed (1 rows)",
+            "E *StateChanged: The second run changed the outbox:",
+            "E *  1 emails sent",
+        ),
+    ),
+    "test_watch_paths": (
+        "check_idempotency",
+        (
+            "E *StateChanged: The second run changed the watched files:",
+            "E *  modified: */export.log",
+            "E *  modified: */exports/export.log",
+            "E *  added: */batch_1.csv",
+            "E *  removed: */b",
+        ),
+    ),
 }
 TEST_SUITE = [
     (conftest, *tup) for conftest, tuples in TEST_MAPPING.items() for tup in tuples
@@ -49,6 +208,477 @@ def test_plugin(
     pytester.makeconftest(CONFTEST_MAP[conftest])
     pytester.copy_example(f"tests/test_files/{filename}.py")
 
+    result = pytester.runpytest(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", *ARGS_MAP.get(conftest, ())
+    )
+
+    result.assert_outcomes(**expected._asdict())
+
+
+@pytest.mark.parametrize(
+    ("filename", "expected"),
+    [
+        ("test_first_failed_skip_second", Result(skipped=1)),
+        ("test_not_idempotent", Result(failed=1)),
+    ],
+)
+def test_cached_first_run(pytester: Pytester, filename: str, expected: Result) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example(f"tests/test_files/{filename}.py")
+    pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    result = pytester.runpytest(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", "-k", "check_idempotency"
+    )
+
+    result.assert_outcomes(**expected._asdict())
+
+
+def test_cached_first_run_missing(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_first_failed_skip_second.py")
+
+    result = pytester.runpytest(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", "-k", "check_idempotency"
+    )
+
+    result.assert_outcomes(failed=1, warnings=1)
+
+
+def test_cached_first_runs_of_several_files(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_first_failed_skip_second.py")
+    pytester.copy_example("tests/test_files/test_not_idempotent.py")
+    pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    result = pytester.runpytest(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", "-k", "check_idempotency"
+    )
+
+    result.assert_outcomes(skipped=1, failed=1)
+    # Only the cached first runs of the last test file are kept in memory.
+    assert _global_state.cached_first_runs is not None
+    assert _global_state.cached_first_runs[0] == "test_not_idempotent.py"
+
+
+def test_incremental(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    test_file = pytester.copy_example("tests/test_files/test_incremental.py")
+    args = (
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "--idempotent-incremental",
+    )
+
+    pytester.runpytest(*args).assert_outcomes(passed=7, failed=1)
+
+    result = pytester.runpytest(*args)
+
+    result.assert_outcomes(passed=4, failed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*= incremental idempotency checks =*",
+            "Skipped the idempotency checks of 2 unchanged tests.",
+        ]
+    )
+
+    test_file.write_text(
+        test_file.read_text().replace("store.pop(key, None)", "store.pop(key, 0)")
+    )
+    result = pytester.runpytest(*args)
+
+    result.assert_outcomes(passed=5, failed=1)
+    result.stdout.fnmatch_lines(
+        ["Skipped the idempotency checks of 1 unchanged tests."]
+    )
+
+
+def test_incremental_partial_run(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_incremental.py")
+    args = (
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "--idempotent-incremental",
+    )
+
+    pytester.runpytest(*args, "-k", "test_upsert and not b").assert_outcomes(passed=2)
+
+    result = pytester.runpytest(*args)
+
+    result.assert_outcomes(passed=7, failed=1)
+    result.stdout.no_fnmatch_line("*= incremental idempotency checks =*")
+
+    result = pytester.runpytest(*args)
+
+    result.assert_outcomes(passed=4, failed=1)
+    result.stdout.fnmatch_lines(
+        ["Skipped the idempotency checks of 2 unchanged tests."]
+    )
+
+
+def test_auto_marked_tests(pytester: Pytester) -> None:
+    pytester.makeconftest(AUTO_ENFORCE_TESTS_CONFTEST)
+    test_file = pytester.copy_example("tests/test_files/test_auto_marked.py")
+
+    result = pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    result.assert_outcomes(passed=6)
+    result.stdout.fnmatch_lines(
+        [
+            "*= automatic idempotency markers =*",
+            "marked test_auto_marked.py::test_upsert",
+            "marked test_auto_marked.py::test_increment",
+        ]
+    )
+
+    result = pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    result.assert_outcomes(passed=8, failed=1)
+    result.stdout.no_fnmatch_line("*= automatic idempotency markers =*")
+
+    test_file.write_text(
+        test_file.read_text().replace('increment(store, "a")', 'store["a"] = 1')
+    )
+    result = pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    result.assert_outcomes(passed=8, skipped=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*= automatic idempotency markers =*",
+            "unmarked test_auto_marked.py::test_increment",
+        ]
+    )
+
+
+def test_auto_marked_doctest(pytester: Pytester) -> None:
+    pytester.makeconftest(AUTO_ENFORCE_TESTS_CONFTEST)
+    pytester.copy_example("tests/test_files/test_auto_marked.py")
+
+    result = pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "--doctest-modules",
+        "test_auto_marked.py::test_auto_marked.upsert_all",
+    )
+
+    result.assert_outcomes(passed=1)
+    result.stdout.no_fnmatch_line("*= automatic idempotency markers =*")
+
+
+def read_first_runs(pytester: Pytester) -> "dict[str, Any]":
+    first_runs = {}
+    cache_dir = pytester.path / ".pytest_cache/v/pytest_idempotent/first_runs_by_file"
+    for path in cache_dir.iterdir():
+        first_runs.update(json.loads(path.read_text()))
+    return first_runs
+
+
+def test_cached_first_runs_pruned(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_class.py")
+    removed_file = pytester.copy_example("tests/test_files/test_not_idempotent.py")
+    pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    first_runs = read_first_runs(pytester)
+
+    assert len(first_runs) == 4
+    assert "test_not_idempotent.py::test_case" in first_runs
+
+    removed_file.unlink()
+    pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning", "-k", "x")
+
+    assert read_first_runs(pytester).keys() == first_runs.keys() - {
+        "test_not_idempotent.py::test_case"
+    }
+
+
+def test_cached_first_runs_kept_when_selecting_by_nodeid(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_class.py")
+    pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+    first_runs = read_first_runs(pytester)
+
+    pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "test_class.py::TestVariousFunctions::test_func",
+    )
+
+    assert read_first_runs(pytester) == first_runs
+
+
+def test_cached_first_runs_kept_after_crash(
+    pytester: Pytester, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PYTHONPATH", str(Path(__file__).parents[1]))
+    pytester.makeconftest(
+        DEFAULT_CONFTEST + "\nimport pytest_idempotent\n"
+        "pytest_idempotent.FIRST_RUNS_FLUSH_SIZE = 1\n"
+    )
+    pytester.copy_example("tests/test_files/test_class.py")
+    pytester.makepyfile(
+        test_zz_crash="import os\n\ndef test_crash():\n    os._exit(1)\n"
+    )
+    pytester.runpytest_subprocess("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    assert len(read_first_runs(pytester)) == 3
+
+
+def test_static_analysis_does_not_import_packages(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    package = pytester.mkpydir("lazy")
+    (package / "__init__.py").write_text(
+        "from pathlib import Path\n\nPath('imported').touch()\n"
+    )
+    (package / "work.py").write_text("def work() -> None:\n    pass\n")
+    pytester.makepyfile(
+        test_lazy="""
+        import pytest
+
+        @pytest.mark.idempotent
+        def test_lazy() -> None:
+            from lazy.work import work
+
+            work()
+        """
+    )
+
+    result = pytester.runpytest("--idempotent-static-analysis", "--collect-only")
+
+    result.assert_outcomes()
+    assert not (pytester.path / "imported").exists()
+
+
+def test_duplicate_tests(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_correct_behavior.py")
+
+    result = pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "--keep-duplicates",
+        "test_correct_behavior.py",
+        "test_correct_behavior.py",
+    )
+
+    result.assert_outcomes(passed=4)
+
+
+def test_sampling_summary(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_sample_rate.py")
+
+    results = [
+        pytester.runpytest(
+            "-W", "ignore::pytest.PytestAssertRewriteWarning", *args
+        ).stdout.get_lines_after("*= idempotency sampling =*")[0]
+        for args in ((), (), ("--idempotent-sample-seed", "1"))
+    ]
+
+    assert results[0] == results[1]
+    assert results[0] != results[2]
+    assert results[0] == (
+        "49 of 101 calls to sampled @idempotent functions were checked, "
+        "52 were skipped (seed: 0)."
+    )
+
+
+@pytest.mark.parametrize(
+    ("filename", "keyword", "expected_lines"),
+    [(filename, *tup) for filename, tup in FAILURE_MESSAGES.items()],
+)
+def test_failure_messages(
+    pytester: Pytester, filename: str, keyword: str, expected_lines: "tuple[str, ...]"
+) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example(f"tests/test_files/{filename}.py")
+
+    result = pytester.runpytest(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", "-k", keyword
+    )
+
+    result.stdout.fnmatch_lines_random(list(expected_lines))
+    assert max(map(len, result.outlines)) < 300
+
+
+def test_fork_timeout(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_fork_timeout.py")
+
+    result = pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "-o",
+        "idempotent_fork_timeout=0.5",
+    )
+
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(
+        ["E *ForkedRunFailed: * did not finish within * of 0.5 seconds, *"]
+    )
+    assert result.duration < 10
+
+
+def test_check_memory_first_in_session(
+    pytester: Pytester, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("PYTHONPATH", str(Path(__file__).parents[1]))
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_check_memory.py")
+
+    result = pytester.runpytest_subprocess(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", "-k", "test_discarded_result"
+    )
+
+    result.assert_outcomes(passed=2)
+
+
+def test_numpy_comparators(pytester: Pytester) -> None:
+    pytest.importorskip("numpy")
+    pytest.importorskip("pandas")
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_equal_return_numpy.py")
+
+    result = pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
+
+    result.assert_outcomes(passed=12, failed=6)
+    result.stdout.fnmatch_lines_random(
+        [
+            "E *must be equal: array(?0, 1, 2?) != ?0, 1, 2?",
+            "E *First differences: ?'run_1'?: array(?0, 1, 2?) != <missing>, *",
+            "E *must be equal: 2 of 10000 array elements differ",
+            "E *First differences: (50, 1): 1.0 != 0.0, (50, 2): 0.0 != 1.0",
+            "E *must be equal: DataFrames of shape (100, 2) differ",
+            "E *First differences: ?'b'??1?: 0 != 1, ?'b'??3?: 0 != 1, *",
+            "E *First differences: ?'cccc*...*cccc'??1?: 0 != 1",
+            "E *First differences: ?'arrays'??1?: 2 of 5 array elements differ",
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    ("filename", "expected"),
+    [
+        ("test_async_anyio", Result(passed=4, failed=2)),
+        ("test_async_anyio_module_fixture", Result(passed=2, failed=2)),
+    ],
+)
+def test_anyio(pytester: Pytester, filename: str, expected: Result) -> None:
+    pytest.importorskip("anyio")
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example(f"tests/test_files/{filename}.py")
+
     result = pytester.runpytest("-W", "ignore::pytest.PytestAssertRewriteWarning")
 
     result.assert_outcomes(**expected._asdict())
+
+
+@pytest.mark.parametrize("xdist", [False, True])
+def test_timing_report(
+    pytester: Pytester, monkeypatch: pytest.MonkeyPatch, xdist: bool
+) -> None:
+    if xdist:
+        pytest.importorskip("xdist")
+        monkeypatch.setenv("PYTHONPATH", str(Path.cwd()))
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_class.py")
+
+    result = pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "--idempotent-durations=1",
+        "--idempotent-report=report.json",
+        *(("-n", "2") if xdist else ()),
+    )
+
+    result.stdout.fnmatch_lines(
+        [
+            "*= slowest 1 idempotency checks by functions =*",
+            "*ms run 2  *ms run 1  3/7 calls checked  test_class.func",
+            "*= slowest 1 idempotency checks by tests =*",
+            "*ms run 2  *ms run 1  1/1 calls checked  test_class.py::*",
+        ]
+    )
+    timings = json.loads((pytester.path / "report.json").read_text())["timings"]
+    assert len(timings) == 7
+    assert {timing["function"] for timing in timings} == {"test_class.func"}
+    assert sum(timing["checked_calls"] for timing in timings) == 3
+
+
+def test_generator_timing_report(pytester: Pytester) -> None:
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example("tests/test_files/test_generators.py")
+
+    pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "--idempotent-report=report.json",
+        "-k",
+        "test_sum_rows",
+    ).assert_outcomes(passed=2)
+
+    timings = json.loads((pytester.path / "report.json").read_text())["timings"]
+    assert [
+        (timing["function"], timing["calls"], timing["checked_calls"])
+        for timing in timings
+    ] == [("test_generators.sum_rows", 1, 0), ("test_generators.sum_rows", 1, 1)]
+    assert all(timing["run_1_ns"] > 0 for timing in timings)
+
+
+@pytest.mark.parametrize(
+    ("filename", "expected"),
+    [
+        ("test_class", Result(passed=7)),
+        ("test_warn_unnecessary_marker", Result(passed=5, skipped=4, warnings=4)),
+    ],
+)
+def test_xdist_pair_scheduling(
+    pytester: Pytester,
+    monkeypatch: pytest.MonkeyPatch,
+    filename: str,
+    expected: Result,
+) -> None:
+    pytest.importorskip("xdist")
+    monkeypatch.setenv("PYTHONPATH", str(Path.cwd()))
+    pytester.makeconftest(DEFAULT_CONFTEST)
+    pytester.copy_example(f"tests/test_files/{filename}.py")
+
+    result = pytester.runpytest(
+        "-W",
+        "ignore::pytest.PytestAssertRewriteWarning",
+        "-n",
+        "2",
+        "--dist",
+        "loadgroup",
+    )
+
+    result.assert_outcomes(**expected._asdict())
+
+
+@pytest.mark.parametrize("dist", ["load", "loadgroup"])
+def test_xdist_groups_only_with_loadgroup(
+    pytester: Pytester, monkeypatch: pytest.MonkeyPatch, dist: str
+) -> None:
+    pytest.importorskip("xdist")
+    monkeypatch.setenv("PYTHONPATH", str(Path.cwd()))
+    pytester.makeconftest(
+        DEFAULT_CONFTEST
+        + """
+
+def pytest_collection_finish(session):
+    groups = [item.get_closest_marker("xdist_group") for item in session.items]
+    worker = session.config.workerinput["workerid"]
+    with open(f"{worker}.groups", "w") as file:
+        file.write(str(sum(group is not None for group in groups)))
+"""
+    )
+    pytester.copy_example("tests/test_files/test_class.py")
+
+    result = pytester.runpytest(
+        "-W", "ignore::pytest.PytestAssertRewriteWarning", "-n", "2", "--dist", dist
+    )
+
+    result.assert_outcomes(passed=7)
+    groups = {path.read_text() for path in pytester.path.glob("*.groups")}
+    assert groups == ({"6"} if dist == "loadgroup" else {"0"})
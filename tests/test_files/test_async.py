@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+class ExpectedException(Exception):
+    message = "This is a known error for idempotency."
+
+
+@idempotent(equal_return=True)
+async def idempotent_coroutine(x: list[int]) -> int:
+    await asyncio.sleep(0)
+    if not x:
+        x += [9]
+    return len(x)
+
+
+@idempotent
+async def not_idempotent_coroutine(x: list[int]) -> None:
+    await asyncio.sleep(0)
+    x += [9]
+
+
+@idempotent(raises_exception=ExpectedException)
+async def raises_expected_exception(x: list[int]) -> None:
+    await asyncio.sleep(0)
+    if x:
+        raise ExpectedException
+    x += [9]
+
+
+@pytest.mark.idempotent
+def test_idempotent_coroutine() -> None:
+    x: list[int] = []
+
+    result = asyncio.run(idempotent_coroutine(x))
+
+    assert result == 1
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_not_idempotent_coroutine() -> None:
+    x: list[int] = []
+
+    asyncio.run(not_idempotent_coroutine(x))
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_raises_expected_exception() -> None:
+    x: list[int] = []
+
+    asyncio.run(raises_expected_exception(x))
+
+    assert x == [9]
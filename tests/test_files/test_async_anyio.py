@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import anyio
+import anyio.lowlevel
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent(equal_return=True)
+async def idempotent_coroutine(x: list[int]) -> int:
+    await anyio.lowlevel.checkpoint()
+    if not x:
+        x += [9]
+    return len(x)
+
+
+@idempotent
+async def not_idempotent_coroutine(x: list[int]) -> None:
+    await anyio.lowlevel.checkpoint()
+    x += [9]
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.mark.anyio
+@pytest.mark.idempotent
+async def test_idempotent_coroutine() -> None:
+    x: list[int] = []
+
+    result = await idempotent_coroutine(x)
+
+    assert result == 1
+    assert x == [9]
+
+
+@pytest.mark.anyio
+@pytest.mark.idempotent
+async def test_not_idempotent_coroutine() -> None:
+    x: list[int] = []
+
+    await not_idempotent_coroutine(x)
+
+    assert x == [9]
+
+
+@pytest.mark.anyio
+@pytest.mark.idempotent
+async def test_not_idempotent_coroutine_in_task_group() -> None:
+    x: list[int] = []
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(not_idempotent_coroutine, x)
+
+    assert x == [9]
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import anyio.lowlevel
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent
+async def not_idempotent_coroutine(x: list[int]) -> None:
+    await anyio.lowlevel.checkpoint()
+    x += [9]
+
+
+@pytest.fixture(scope="module")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+async def connection() -> list[int]:
+    await anyio.lowlevel.checkpoint()
+    return []
+
+
+@pytest.mark.anyio
+@pytest.mark.idempotent
+@pytest.mark.usefixtures("connection")
+async def test_one() -> None:
+    x: list[int] = []
+
+    await not_idempotent_coroutine(x)
+
+    assert x == [9]
+
+
+@pytest.mark.anyio
+@pytest.mark.idempotent
+@pytest.mark.usefixtures("connection")
+async def test_two() -> None:
+    x: list[int] = []
+
+    await not_idempotent_coroutine(x)
+
+    assert x == [9]
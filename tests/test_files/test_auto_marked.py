@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent
+def upsert(store: dict[str, int], key: str) -> None:
+    store[key] = 1
+
+
+def upsert_all(store: dict[str, int], keys: list[str]) -> None:
+    """
+    >>> store = {}
+    >>> upsert_all(store, ["a", "b"])
+    >>> store
+    {'a': 1, 'b': 1}
+    """
+    for key in keys:
+        upsert(store, key)
+
+
+@idempotent
+def increment(store: dict[str, int], key: str) -> None:
+    store[key] = store.get(key, 0) + 1
+
+
+@pytest.mark.parametrize("key", ["a", "b"])
+def test_upsert(key: str) -> None:
+    store: dict[str, int] = {}
+
+    upsert(store, key)
+
+    assert store == {key: 1}
+
+
+def test_increment() -> None:
+    store: dict[str, int] = {}
+
+    increment(store, "a")
+
+    assert store == {"a": 1}
+
+
+def test_without_idempotent_function() -> None:
+    assert {"a": 1} == {"a": 1}
+
+
+@pytest.mark.idempotent
+def test_marked_upsert() -> None:
+    store: dict[str, int] = {}
+
+    upsert(store, "a")
+
+    assert store == {"a": 1}
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+class AlreadyProcessed(Exception):
+    message = "This is a known error for idempotency."
+
+
+@dataclass
+class Order:
+    items: list[str] = field(default_factory=list)
+    status: str = "new"
+
+
+class Counter:
+    __slots__ = ("__count",)
+
+    def __init__(self) -> None:
+        self.__count = 0
+
+    def bump(self) -> None:
+        self.__count = 1 - self.__count
+
+
+@idempotent(check_args=True)
+def append_nine(x: list[int]) -> None:
+    x += [9]
+
+
+@idempotent(check_args=True)
+def add_nine(x: list[int]) -> None:
+    if 9 not in x:
+        x += [9]
+
+
+@idempotent(check_args=True)
+def submit(order: Order, *, item: str, audit: dict[str, list[str]]) -> None:
+    order.items.append(item)
+    order.status = "submitted"
+    audit.setdefault("submitted", []).append(item)
+
+
+@idempotent(check_args=True)
+def mark_submitted(order: Order, counts: bytearray) -> None:
+    order.status = "submitted"
+    counts[0] = 1
+
+
+@idempotent(check_args=True)
+def decrement(x: list[int]) -> None:
+    x[0] -= 1
+
+
+@idempotent(check_args=True)
+def visit(visits: OrderedDict[str, int], audit: defaultdict[str, list[str]]) -> None:
+    visits.move_to_end(next(iter(visits)))
+    audit["visited"].append("a")
+
+
+@idempotent(check_args=True)
+def toggle(counter: Counter) -> None:
+    counter.bump()
+
+
+@idempotent(check_args=True)
+def release(lock: threading.Lock) -> None:
+    if lock.locked():
+        lock.release()
+
+
+@idempotent(check_args=True)
+def append_payload(lines: list[str], payload: bytes) -> None:
+    lines[-1] += payload.decode()
+
+
+@idempotent(check_args=True)
+def archive(ids: list[int], archived: set[int]) -> None:
+    ids[-1] -= 1
+    archived.add(len(archived))
+
+
+@idempotent(check_args=True, raises_exception=AlreadyProcessed)
+def insert(rows: dict[str, list[int]]) -> None:
+    rows.setdefault("attempts", []).append(1)
+    if "key" in rows:
+        raise AlreadyProcessed
+    rows["key"] = [1]
+
+
+@pytest.mark.idempotent
+def test_append_nine() -> None:
+    x: list[int] = []
+
+    append_nine(x)
+
+    assert 9 in x
+
+
+@pytest.mark.idempotent
+def test_add_nine() -> None:
+    x: list[int] = []
+
+    add_nine(x)
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_submit() -> None:
+    order = Order()
+
+    submit(order, item="book", audit={})
+
+    assert order.status == "submitted"
+
+
+@pytest.mark.idempotent
+def test_mark_submitted() -> None:
+    order = Order()
+
+    mark_submitted(order, bytearray(1000))
+
+    assert order.status == "submitted"
+
+
+@pytest.mark.idempotent
+def test_insert() -> None:
+    rows: dict[str, list[int]] = {}
+
+    insert(rows)
+
+    assert rows["key"] == [1]
+
+
+@pytest.mark.idempotent
+def test_decrement() -> None:
+    x = [0]
+
+    decrement(x)
+
+    assert x[0] < 0
+
+
+@pytest.mark.idempotent
+def test_visit() -> None:
+    visits = OrderedDict(a=1, b=1)
+
+    visit(visits, defaultdict(list))
+
+    assert set(visits) == {"a", "b"}
+
+
+@pytest.mark.idempotent
+def test_toggle() -> None:
+    toggle(Counter())
+
+
+@pytest.mark.idempotent
+def test_release() -> None:
+    lock = threading.Lock()
+    lock.acquire()
+
+    release(lock)
+
+    assert not lock.locked()
+
+
+@pytest.mark.idempotent
+def test_append_payload() -> None:
+    lines = ["header", "x" * 10_000]
+
+    append_payload(lines, b"y" * 10_000)
+
+    assert lines[-1].endswith("y")
+
+
+@pytest.mark.idempotent
+def test_archive() -> None:
+    ids = list(range(100_000))
+    archived = set(range(10_000))
+
+    archive(ids, archived)
+
+    assert len(archived) == 10_001
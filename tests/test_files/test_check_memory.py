@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+registry: list[bytearray] = []
+cache: dict[str, bytearray] = {}
+
+
+@idempotent(check_memory=True)
+def leaky_register(key: str) -> None:
+    registry.append(bytearray(100_000))
+    cache[key] = registry[-1]
+
+
+@idempotent(check_memory=True)
+def cached_register(key: str) -> None:
+    if key not in cache:
+        cache[key] = bytearray(100_000)
+
+
+@idempotent(check_memory=True, equal_return=True)
+def build_report(size: int) -> bytes:
+    return bytes(size)
+
+
+@idempotent(check_memory=True)
+async def leaky_async_register(key: str) -> None:
+    await asyncio.sleep(0)
+    registry.append(bytearray(100_000))
+    cache[key] = registry[-1]
+
+
+@pytest.mark.idempotent
+def test_leaky_register() -> None:
+    leaky_register("leaky")
+
+    assert "leaky" in cache
+
+
+@pytest.mark.idempotent
+def test_cached_register() -> None:
+    cached_register("cached")
+
+    assert "cached" in cache
+
+
+@pytest.mark.idempotent
+def test_discarded_result() -> None:
+    assert build_report(100_000) == bytes(100_000)
+
+
+@pytest.mark.idempotent
+def test_leaky_async_register() -> None:
+    asyncio.run(leaky_async_register("leaky_async"))
+
+    assert "leaky_async" in cache
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+calls: list[object] = []
+
+
+@idempotent(check_once_per_args=True)
+def record(key: object) -> None:
+    calls.append(key)
+
+
+@idempotent(check_once_per_args=True, sample_rate=0.5)
+def record_sampled(key: object) -> None:
+    calls.append(key)
+
+
+@pytest.mark.idempotent
+def test_case() -> None:
+    calls.clear()
+
+    for _ in range(3):
+        record("hashable")
+        record(["unhashable"])
+
+    assert calls.count("hashable") in (3, 4)
+    assert calls.count(["unhashable"]) in (3, 6)
+
+
+@pytest.mark.idempotent
+def test_argument_types() -> None:
+    calls.clear()
+
+    for key in (1, True, 1.0):
+        record(key)
+        record(key=key)
+
+    assert len(calls) in (6, 12)
+
+
+@pytest.mark.idempotent
+def test_sampled(request: pytest.FixtureRequest) -> None:
+    """Calls that are not sampled are not recorded as checked."""
+    calls.clear()
+
+    for _ in range(50):
+        record_sampled("key")
+
+    assert len(calls) == (51 if "check_idempotency" in request.node.nodeid else 50)
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+calls: list[object] = []
+
+
+@idempotent
+def record(key: object) -> None:
+    calls.append(key)
+
+
+@idempotent(check_once_per_args=False)
+def record_always(key: object) -> None:
+    calls.append(key)
+
+
+@pytest.mark.idempotent
+def test_case() -> None:
+    calls.clear()
+
+    for _ in range(3):
+        record("setting")
+        record_always("override")
+
+    assert calls.count("setting") in (3, 4)
+    assert calls.count("override") in (3, 6)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+lock = threading.Lock()
+
+
+class AlreadyProcessed(Exception):
+    message = "This is a known error for idempotency."
+
+
+@idempotent(concurrent=4)
+def racy_upsert(store: dict[str, int]) -> None:
+    if "key" not in store:
+        time.sleep(0.01)
+        store["count"] = store.get("count", 0) + 1
+        store["key"] = 1
+
+
+@idempotent(concurrent=4)
+def locked_upsert(store: dict[str, int]) -> None:
+    with lock:
+        if "key" not in store:
+            time.sleep(0.01)
+            store["count"] = store.get("count", 0) + 1
+            store["key"] = 1
+
+
+@idempotent(concurrent=4, raises_exception=AlreadyProcessed)
+def locked_insert(store: dict[str, int]) -> None:
+    with lock:
+        if "key" in store:
+            raise AlreadyProcessed
+        store["count"] = store.get("count", 0) + 1
+        store["key"] = 1
+
+
+@idempotent
+def plain_upsert(store: dict[str, int]) -> None:
+    with lock:
+        if "key" not in store:
+            store["count"] = store.get("count", 0) + 1
+            store["key"] = 1
+
+
+@idempotent(check_args=True)
+def checked_upsert(store: dict[str, int]) -> None:
+    with lock:
+        store.setdefault("key", 1)
+
+
+@idempotent(concurrent=3)
+async def racy_async_upsert(store: dict[str, int]) -> None:
+    if "key" not in store:
+        await asyncio.sleep(0)
+        store["count"] = store.get("count", 0) + 1
+        store["key"] = 1
+
+
+@pytest.mark.idempotent
+def test_racy_upsert() -> None:
+    store: dict[str, int] = {}
+
+    racy_upsert(store)
+
+    assert store["count"] == 1
+
+
+@pytest.mark.idempotent
+def test_locked_upsert() -> None:
+    store: dict[str, int] = {}
+
+    locked_upsert(store)
+
+    assert store["count"] == 1
+
+
+@pytest.mark.idempotent
+def test_locked_insert() -> None:
+    store: dict[str, int] = {}
+
+    locked_insert(store)
+
+    assert store["count"] == 1
+
+
+@pytest.mark.idempotent(concurrent=3)
+def test_marker_concurrent() -> None:
+    store: dict[str, int] = {}
+
+    plain_upsert(store)
+
+    assert store["count"] == 1
+
+
+@pytest.mark.idempotent
+def test_racy_async_upsert() -> None:
+    store: dict[str, int] = {}
+
+    asyncio.run(racy_async_upsert(store))
+
+    assert store["count"] == 1
+
+
+@pytest.mark.idempotent(concurrent=2)
+def test_concurrent_marker_check_args() -> None:
+    store: dict[str, int] = {}
+
+    checked_upsert(store)
+
+    assert store["key"] == 1
+
+
+@pytest.mark.idempotent(concurrent=2, watch_paths=["tmp_path"])
+def test_concurrent_marker_watch_paths(tmp_path: Path) -> None:
+    plain_upsert({})
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.idempotent(concurrent=1)
+def test_concurrent_marker_single_run() -> None:
+    store: dict[str, int] = {}
+
+    plain_upsert(store)
+
+    assert store["key"] == 1
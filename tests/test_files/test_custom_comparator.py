@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent(equal_return=True)
+def total(calls: list[int]) -> float:
+    calls.append(1)
+    return 0.1 * 3 + len(calls) * 1e-12
+
+
+@pytest.mark.idempotent
+def test_case() -> None:
+    assert round(total([]), 6) == 0.3
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent(equal_return=True)
+def build_bytes(calls: list[int]) -> bytes:
+    calls.append(1)
+    data = bytearray(1_000_000)
+    data[500_000 + len(calls)] = 1
+    return bytes(data)
+
+
+@idempotent(equal_return=True)
+def build_zeros(size: int) -> bytes:
+    return bytes(size)
+
+
+@idempotent(equal_return=True)
+def build_memoryview(size: int) -> memoryview:
+    return memoryview(bytearray(size))
+
+
+@idempotent(equal_return=True)
+def build_list(calls: list[int]) -> list[int]:
+    calls.append(1)
+    return [0] * 1000 + calls
+
+
+@idempotent(equal_return=True)
+def build_dict(calls: list[int]) -> dict[str, int]:
+    calls.append(1)
+    return {"a": 1, "calls": len(calls)}
+
+
+@idempotent(equal_return=True)
+def build_dict_with_long_key(calls: list[int]) -> dict[str, int]:
+    calls.append(1)
+    return {f"{'k' * 200}{len(calls)}": 1}
+
+
+@pytest.mark.idempotent
+def test_equal_bytes() -> None:
+    assert len(build_zeros(1_000_000)) == 1_000_000
+
+
+@pytest.mark.idempotent
+def test_different_bytes() -> None:
+    assert len(build_bytes([])) == 1_000_000
+
+
+@pytest.mark.idempotent
+def test_equal_memoryview() -> None:
+    assert len(build_memoryview(1_000_000)) == 1_000_000
+
+
+@pytest.mark.idempotent
+def test_different_list() -> None:
+    assert len(build_list([])) == 1001
+
+
+@pytest.mark.idempotent
+def test_different_dict() -> None:
+    assert build_dict([]) == {"a": 1, "calls": 1}
+
+
+@pytest.mark.idempotent
+def test_different_dict_long_key() -> None:
+    assert len(build_dict_with_long_key([])) == 1
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent(equal_return=True)
+def build_array(size: int) -> np.ndarray:
+    array = np.zeros(size)
+    array[0] = np.nan
+    return array
+
+
+@idempotent(equal_return=True)
+def build_array_with_calls(calls: list[int]) -> np.ndarray:
+    calls.append(1)
+    array = np.zeros((100, 100))
+    array[50, len(calls)] = 1
+    return array
+
+
+@idempotent(equal_return=True)
+def build_dataframe(size: int) -> pd.DataFrame:
+    return pd.DataFrame({"a": np.arange(size), "b": np.full(size, np.nan)})
+
+
+@idempotent(equal_return=True)
+def build_dataframe_with_calls(calls: list[int]) -> pd.DataFrame:
+    calls.append(1)
+    return pd.DataFrame({"a": np.arange(100), "b": np.arange(100) % len(calls)})
+
+
+@idempotent(equal_return=True)
+def build_dataframe_with_long_column(calls: list[int]) -> pd.DataFrame:
+    calls.append(1)
+    return pd.DataFrame({"c" * 200: np.arange(3) % len(calls)})
+
+
+@idempotent(equal_return=True)
+def build_containers(size: int) -> tuple[np.ndarray, dict[str, Any]]:
+    array = np.arange(size, dtype=float)
+    array[0] = np.nan
+    return array, {"df": pd.DataFrame({"a": np.arange(size)}), "b": [np.ones(size)]}
+
+
+@idempotent(equal_return=True)
+def build_containers_with_calls(calls: list[int]) -> dict[str, list[np.ndarray]]:
+    calls.append(1)
+    return {"arrays": [np.zeros(5), np.arange(5) % len(calls)]}
+
+
+@idempotent(equal_return=True)
+def build_array_or_list(calls: list[int]) -> np.ndarray | list[int]:
+    calls.append(1)
+    return np.arange(3) if len(calls) == 1 else [0, 1, 2]
+
+
+@idempotent(equal_return=True)
+def build_arrays_by_run(calls: list[int]) -> dict[str, np.ndarray]:
+    calls.append(1)
+    return {f"run_{len(calls)}": np.arange(3)}
+
+
+@pytest.mark.idempotent
+def test_equal_array() -> None:
+    assert build_array(1000).shape == (1000,)
+
+
+@pytest.mark.idempotent
+def test_different_array() -> None:
+    assert build_array_with_calls([]).sum() == 1
+
+
+@pytest.mark.idempotent
+def test_equal_dataframe() -> None:
+    assert len(build_dataframe(1000)) == 1000
+
+
+@pytest.mark.idempotent
+def test_different_dataframe() -> None:
+    assert len(build_dataframe_with_calls([])) == 100
+
+
+@pytest.mark.idempotent
+def test_different_dataframe_long_column() -> None:
+    assert len(build_dataframe_with_long_column([])) == 3
+
+
+@pytest.mark.idempotent
+def test_equal_containers() -> None:
+    array, frames = build_containers(100)
+
+    assert len(array) == len(frames["df"]) == 100
+
+
+@pytest.mark.idempotent
+def test_different_containers() -> None:
+    assert len(build_containers_with_calls([])["arrays"]) == 2
+
+
+@pytest.mark.idempotent
+def test_array_then_list() -> None:
+    assert len(build_array_or_list([])) == 3
+
+
+@pytest.mark.idempotent
+def test_different_keys() -> None:
+    assert list(build_arrays_by_run([])) == ["run_1"]
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from typing import Iterator
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+calls: list[int] = []
+
+
+@idempotent(enforce_tests=False)
+def cleanup() -> None:
+    calls.append(1)
+
+
+@pytest.fixture(scope="class")
+def resource() -> Iterator[None]:
+    yield
+    cleanup()
+
+
+class TestResource:
+    @pytest.mark.idempotent
+    def test_uses_resource(self, resource: None) -> None:
+        del resource
+        cleanup()
+        calls.clear()
+
+
+def test_cleanup_ran_once() -> None:
+    assert calls == [1]
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+processed: set[str] = set()
+
+
+@idempotent(isolation="fork")
+def hang_if_processed(key: str) -> None:
+    if key in processed:
+        time.sleep(30)
+    processed.add(key)
+
+
+@pytest.mark.idempotent
+def test_hang() -> None:
+    processed.clear()
+
+    hang_if_processed("a")
+
+    assert processed == {"a"}
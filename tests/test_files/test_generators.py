@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterator
+    from pathlib import Path
+
+
+class AlreadyProcessed(Exception):
+    message = "This is a known error for idempotency."
+
+
+@idempotent(equal_return=True)
+def read_rows(rows: list[int]) -> Iterator[int]:
+    yield from rows
+
+
+@idempotent
+def export_rows(rows: list[int], exported: list[int]) -> Iterator[int]:
+    for row in rows:
+        exported.append(row)
+        yield row
+
+
+@idempotent(equal_return=True)
+def number_rows(rows: list[int], counter: list[int]) -> Iterator[int]:
+    for row in rows:
+        counter[0] += 1
+        yield row * counter[0]
+
+
+@idempotent(equal_return=True)
+def read_rows_once(rows: list[int], read: set[str]) -> Iterator[int]:
+    if "rows" in read:
+        return
+    read.add("rows")
+    yield from rows
+
+
+@idempotent(equal_return=True)
+def count_forever() -> Iterator[int]:
+    count = 0
+    while True:
+        yield count
+        count += 1
+
+
+@idempotent(equal_return=True, raises_exception=AlreadyProcessed)
+def claim_rows(rows: list[int], claimed: set[int]) -> Iterator[int]:
+    if claimed:
+        raise AlreadyProcessed
+    for row in rows:
+        claimed.add(row)
+        yield row
+
+
+@idempotent(equal_return=True)
+def sum_rows(rows: list[int]) -> Generator[int, None, int]:
+    yield from rows
+    return sum(rows)
+
+
+@idempotent(equal_return=True)
+def count_reads(rows: list[int], counter: list[int]) -> Generator[int, None, int]:
+    counter[0] += 1
+    reads = counter[0]
+    yield from rows
+    return reads
+
+
+def shout(words: int) -> Generator[str, str, None]:
+    word = yield ""
+    for _ in range(words):
+        word = yield word.upper()
+
+
+def retry_rows(rows: list[int]) -> Generator[int, None, None]:
+    for row in rows:
+        while True:
+            try:
+                yield row
+            except TimeoutError:
+                continue
+            break
+
+
+@pytest.mark.idempotent
+def test_read_rows() -> None:
+    assert list(read_rows([1, 2, 3])) == [1, 2, 3]
+
+
+@pytest.mark.idempotent
+def test_export_rows() -> None:
+    exported: list[int] = []
+
+    assert list(export_rows([1, 2, 3], exported)) == [1, 2, 3]
+
+    assert exported == [1, 2, 3]
+
+
+@pytest.mark.idempotent
+def test_number_rows() -> None:
+    assert list(number_rows([1, 2, 3], [0])) == [1, 4, 9]
+
+
+@pytest.mark.idempotent
+def test_read_rows_once() -> None:
+    assert list(read_rows_once([1, 2, 3], set())) == [1, 2, 3]
+
+
+@pytest.mark.idempotent
+def test_count_forever() -> None:
+    assert list(islice(count_forever(), 5)) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.idempotent
+def test_claim_rows() -> None:
+    claimed: set[int] = set()
+
+    assert list(claim_rows([1, 2, 3], claimed)) == [1, 2, 3]
+
+    assert claimed == {1, 2, 3}
+
+
+@pytest.mark.idempotent
+def test_sum_rows() -> None:
+    def total() -> Generator[int, None, int]:
+        return (yield from sum_rows([1, 2, 3]))
+
+    stream = total()
+
+    assert list(islice(stream, 3)) == [1, 2, 3]
+    with pytest.raises(StopIteration) as stop:
+        next(stream)
+    assert stop.value.value == 6
+
+
+@pytest.mark.idempotent
+def test_count_reads() -> None:
+    assert list(count_reads([1, 2, 3], [0])) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("equal_return", [False, True])
+@pytest.mark.idempotent
+def test_send(equal_return: bool) -> None:
+    stream = idempotent(equal_return=equal_return)(shout)(2)
+
+    assert next(stream) == ""
+    assert stream.send("a") == "A"
+    assert stream.send("b") == "B"
+    with pytest.raises(StopIteration):
+        stream.send("c")
+
+
+@pytest.mark.parametrize("equal_return", [False, True])
+@pytest.mark.idempotent
+def test_throw(equal_return: bool) -> None:
+    stream = idempotent(equal_return=equal_return)(retry_rows)([1, 2])
+
+    assert next(stream) == 1
+    assert stream.throw(TimeoutError) == 1
+    assert list(stream) == [2]
+
+
+@pytest.mark.parametrize(
+    "option",
+    [
+        {"check_args": True},
+        {"check_memory": True},
+        {"max_second_run_ratio": 2.0},
+        {"concurrent": 2},
+    ],
+)
+def test_sequential_checks_rejected(option: dict[str, Any]) -> None:
+    def rows() -> Iterator[int]:
+        yield 1
+
+    with pytest.raises(ValueError, match="is not supported for generator functions"):
+        idempotent(**option)(rows)
+
+
+@pytest.mark.idempotent(watch_paths=["tmp_path"])
+def test_marker_watch_paths(tmp_path: Path) -> None:
+    assert list(read_rows([1, 2, 3])) == [1, 2, 3]
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.idempotent(concurrent=2)
+def test_marker_concurrent() -> None:
+    assert list(read_rows([1, 2, 3])) == [1, 2, 3]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent
+def upsert(store: dict[str, int], key: str) -> None:
+    store[key] = 1
+
+
+@idempotent
+def delete(store: dict[str, int], key: str) -> None:
+    store.pop(key, None)
+
+
+@idempotent
+def increment(store: dict[str, int], key: str) -> None:
+    store[key] = store.get(key, 0) + 1
+
+
+@pytest.mark.idempotent
+@pytest.mark.parametrize("key", ["a", "b"])
+def test_upsert(key: str) -> None:
+    store: dict[str, int] = {}
+
+    upsert(store, key)
+
+    assert store == {key: 1}
+
+
+@pytest.mark.idempotent
+def test_delete() -> None:
+    store = {"a": 1}
+
+    delete(store, "a")
+
+    assert store == {}
+
+
+@pytest.mark.idempotent
+def test_increment() -> None:
+    store: dict[str, int] = {}
+
+    increment(store, "a")
+
+    assert store == {"a": 1}
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+cache: dict[str, int] = {}
+processed: set[str] = set()
+runs: list[str] = []
+
+
+class AlreadyProcessed(Exception):
+    message = "This is a known error for idempotency."
+
+
+@idempotent(isolation="fork")
+def get_cached(key: str) -> int:
+    cache.setdefault("misses", 0)
+    if key not in cache:
+        cache["misses"] += 1
+        cache[key] = len(key)
+    return cache[key]
+
+
+@idempotent(equal_return=True, isolation="fork")
+def log_run(name: str) -> int:
+    runs.append(name)
+    return len(runs)
+
+
+@idempotent(raises_exception=AlreadyProcessed, isolation="fork")
+def process(key: str) -> None:
+    if key in processed:
+        raise AlreadyProcessed
+    processed.add(key)
+
+
+@idempotent(isolation="fork")
+def process_once(key: str) -> None:
+    if key in processed:
+        raise ValueError(f"{key} was already processed")
+    processed.add(key)
+
+
+@idempotent(check_args=True, isolation="fork")
+def append_nine(x: list[int]) -> None:
+    x += [9]
+
+
+@idempotent(isolation="fork")
+def exit_if_processed(key: str) -> None:
+    if key in processed:
+        os._exit(3)
+    processed.add(key)
+
+
+@pytest.fixture(autouse=True)
+def reset_state() -> None:
+    cache.clear()
+    processed.clear()
+    runs.clear()
+
+
+@pytest.mark.idempotent
+def test_get_cached() -> None:
+    assert get_cached("key") == 3
+
+    assert cache["misses"] == 1
+
+
+@pytest.mark.idempotent
+def test_log_run() -> None:
+    assert log_run("first") == 1
+
+
+@pytest.mark.idempotent
+def test_process() -> None:
+    process("key")
+
+    assert processed == {"key"}
+
+
+@pytest.mark.idempotent
+def test_process_once() -> None:
+    process_once("key")
+
+    assert processed == {"key"}
+
+
+@pytest.mark.idempotent
+def test_append_nine() -> None:
+    x: list[int] = []
+
+    append_nine(x)
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_exit_if_processed() -> None:
+    exit_if_processed("key")
+
+    assert processed == {"key"}
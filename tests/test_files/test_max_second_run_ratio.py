@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent(max_second_run_ratio=0.5)
+def short_circuit_upsert(store: dict[str, int]) -> None:
+    if "key" in store:
+        return
+    time.sleep(0.02)
+    store["key"] = 1
+
+
+@idempotent(max_second_run_ratio=0.5)
+def redo_upsert(store: dict[str, int]) -> None:
+    time.sleep(0.02)
+    store["key"] = 1
+
+
+@idempotent(max_second_run_ratio=0.5)
+def fast_upsert(store: dict[str, int]) -> None:
+    store["key"] = 1
+
+
+@idempotent
+def redo_upsert_setting(store: dict[str, int]) -> None:
+    time.sleep(0.02)
+    store["key"] = 1
+
+
+@idempotent(check_memory=True)
+def redo_traced_upsert(store: dict[str, int]) -> None:
+    rows = [str(row) for row in range(20_000)]
+    store["key"] = len(rows)
+
+
+@idempotent(max_second_run_ratio=0.5)
+async def redo_async_upsert(store: dict[str, int]) -> None:
+    await asyncio.sleep(0.02)
+    store["key"] = 1
+
+
+@pytest.mark.idempotent
+def test_short_circuit() -> None:
+    store: dict[str, int] = {}
+
+    short_circuit_upsert(store)
+
+    assert store == {"key": 1}
+
+
+@pytest.mark.idempotent
+def test_redo() -> None:
+    store: dict[str, int] = {}
+
+    redo_upsert(store)
+
+    assert store == {"key": 1}
+
+
+@pytest.mark.idempotent
+def test_below_min_duration() -> None:
+    store: dict[str, int] = {}
+
+    fast_upsert(store)
+
+    assert store == {"key": 1}
+
+
+@pytest.mark.idempotent
+def test_redo_async() -> None:
+    store: dict[str, int] = {}
+
+    asyncio.run(redo_async_upsert(store))
+
+    assert store == {"key": 1}
+
+
+@pytest.mark.idempotent
+def test_redo_setting() -> None:
+    store: dict[str, int] = {}
+
+    redo_upsert_setting(store)
+
+    assert store == {"key": 1}
+
+
+@pytest.mark.idempotent
+def test_redo_traced() -> None:
+    store: dict[str, int] = {}
+
+    redo_traced_upsert(store)
+
+    assert store == {"key": 20_000}
+
+
+def test_check_memory_rejected() -> None:
+    def upsert(store: dict[str, int]) -> None:
+        store["key"] = 1
+
+    with pytest.raises(ValueError, match="check_memory cannot be combined with max"):
+        idempotent(check_memory=True, max_second_run_ratio=2.0)(upsert)
@@ -16,15 +16,39 @@ def inner_idempotent_function(x: list[int]) -> None:
     x.append(2)
 
 
+@idempotent
+def outer_checking_nested_function(x: list[int]) -> None:
+    x.append(1)
+    inner_nested_function(x)
+
+
+@idempotent(nested="all")
+def inner_nested_function(x: list[int]) -> None:
+    x.append(2)
+
+
 @pytest.mark.idempotent
 def test_case() -> None:
     """
-    This test llustrates what happens if we use nested @idempotent decorators.
+    This test illustrates what happens if we use nested @idempotent decorators.
 
-    Only two test cases are run, but the second test has a compounding effect.
+    Only the outermost call is run twice, so the inner function runs once per run.
     """
     x: list[int] = []
 
     outer_not_idempotent_function(x)
 
+    assert x in ([1, 2], [1, 2, 1, 2])
+
+
+@pytest.mark.idempotent
+def test_nested_all() -> None:
+    """
+    With nested="all", the inner function is also run twice within each run of the
+    outer function, which has a compounding effect.
+    """
+    x: list[int] = []
+
+    outer_checking_nested_function(x)
+
     assert x in ([1, 2], [1, 2, 2, 1, 2, 2])
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+calls: list[int] = []
+
+
+@idempotent(sample_rate=0)
+def never_checked(x: list[int]) -> None:
+    x += [9]
+
+
+@idempotent(sample_rate=0.5)
+def record(i: int) -> None:
+    calls.append(i)
+
+
+@pytest.mark.idempotent
+def test_never_checked() -> None:
+    x: list[int] = []
+
+    never_checked(x)
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_sampled() -> None:
+    calls.clear()
+
+    for i in range(100):
+        record(i)
+
+    assert 100 <= len(calls) < 200
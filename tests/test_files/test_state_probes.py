@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import TYPE_CHECKING
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+emails_sent: list[str] = []
+
+
+class OutboxProbe:
+    name = "outbox"
+
+    def snapshot(self) -> int:
+        return len(emails_sent)
+
+    def compare(self, before: int, after: int) -> str:
+        return "" if before == after else f"  {after - before} emails sent"
+
+
+@pytest.fixture
+def db(tmp_path: Path) -> Iterator[sqlite3.Connection]:
+    connection = sqlite3.connect(tmp_path / "orders.db")
+    connection.execute(
+        "CREATE TABLE orders (id INTEGER PRIMARY KEY, status TEXT, attempts INTEGER)"
+    )
+    connection.execute("CREATE TABLE audit (order_id INTEGER)")
+    yield connection
+    connection.close()
+
+
+@idempotent
+def upsert_order(db: sqlite3.Connection, order_id: int) -> None:
+    db.execute(
+        "INSERT INTO orders VALUES (?, 'new', 0) ON CONFLICT (id) DO NOTHING",
+        (order_id,),
+    )
+
+
+@idempotent
+def audit_order(db: sqlite3.Connection, order_id: int) -> None:
+    upsert_order(db, order_id)
+    db.execute("INSERT INTO audit VALUES (?)", (order_id,))
+
+
+@idempotent
+def retry_order(db: sqlite3.Connection, order_id: int) -> None:
+    upsert_order(db, order_id)
+    db.execute("UPDATE orders SET attempts = attempts + 1 WHERE id = ?", (order_id,))
+
+
+@idempotent
+def confirm_order(email: str) -> None:
+    emails_sent.append(email)
+
+
+@pytest.mark.idempotent(probes=["db"])
+def test_upsert_order(db: sqlite3.Connection) -> None:
+    upsert_order(db, 1)
+
+    assert db.execute("SELECT count(*) FROM orders").fetchone() == (1,)
+
+
+@pytest.mark.idempotent(probes=["db"])
+def test_audit_order(db: sqlite3.Connection) -> None:
+    audit_order(db, 1)
+
+    assert db.execute("SELECT count(*) FROM orders").fetchone() == (1,)
+
+
+@pytest.mark.idempotent(probes=["db"])
+def test_retry_order(db: sqlite3.Connection) -> None:
+    retry_order(db, 1)
+
+    assert db.execute("SELECT count(*) FROM orders").fetchone() == (1,)
+
+
+@pytest.mark.idempotent(probes=[OutboxProbe()])
+def test_confirm_order() -> None:
+    confirm_order("customer@example.com")
+
+    assert "customer@example.com" in emails_sent
+
+
+@pytest.mark.idempotent
+def test_audit_order_without_probes(db: sqlite3.Connection) -> None:
+    audit_order(db, 1)
+
+    assert db.execute("SELECT count(*) FROM orders").fetchone() == (1,)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import pytest
+
+import pytest_idempotent
+from pytest_idempotent import idempotent
+
+
+@idempotent
+def idempotent_function(x: list[int]) -> None:
+    if not x:
+        x += [9]
+
+
+@pytest_idempotent.idempotent(equal_return=True)
+def module_decorated_function(x: list[int]) -> None:
+    if not x:
+        x += [9]
+
+
+def helper(x: list[int]) -> None:
+    idempotent_function(x)
+
+
+def undecorated_function(x: list[int]) -> None:
+    if not x:
+        x += [9]
+
+
+class Service:
+    def run(self, x: list[int]) -> None:
+        self.update(x)
+
+    @staticmethod
+    def update(x: list[int]) -> None:
+        module_decorated_function(x)
+
+
+@pytest.mark.idempotent
+def test_direct_call() -> None:
+    x: list[int] = []
+
+    idempotent_function(x)
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_indirect_call() -> None:
+    x: list[int] = []
+
+    helper(x)
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_method_call() -> None:
+    x: list[int] = []
+
+    Service().run(x)
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_no_call() -> None:
+    x: list[int] = []
+
+    undecorated_function(x)
+
+    assert x == [9]
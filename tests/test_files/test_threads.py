@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+
+@idempotent
+def idempotent_function(x: list[int]) -> None:
+    if not x:
+        x += [9]
+
+
+@idempotent
+def not_idempotent_function(x: list[int]) -> None:
+    x += [9]
+
+
+@pytest.mark.idempotent
+def test_thread_calls_idempotent_function() -> None:
+    x: list[int] = []
+
+    thread = threading.Thread(target=idempotent_function, args=(x,))
+    thread.start()
+    thread.join()
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_thread_calls_not_idempotent_function() -> None:
+    x: list[int] = []
+
+    thread = threading.Thread(target=not_idempotent_function, args=(x,))
+    thread.start()
+    thread.join()
+
+    assert x == [9]
+
+
+@pytest.mark.idempotent
+def test_copied_context() -> None:
+    x: list[int] = []
+
+    with ThreadPoolExecutor() as executor:
+        context = contextvars.copy_context()
+        executor.submit(context.run, idempotent_function, x).result()
+
+    assert x == [9]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import shutil
+from typing import TYPE_CHECKING
+
+import pytest
+
+from pytest_idempotent import idempotent
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+@idempotent
+def export_report(directory: Path) -> None:
+    (directory / "report.csv").write_text("id,total\n1,10\n")
+
+
+@idempotent
+def export_log(directory: Path) -> None:
+    with (directory / "export.log").open("a") as log:
+        log.write("exported\n")
+
+
+@idempotent
+def export_batch(directory: Path) -> None:
+    batch = len(list(directory.iterdir()))
+    (directory / f"batch_{batch}.csv").write_text("id\n1\n")
+
+
+@idempotent
+def prune_oldest(directory: Path) -> None:
+    min(directory.iterdir()).unlink()
+
+
+@pytest.mark.idempotent(watch_paths=["tmp_path"])
+def test_export_report(tmp_path: Path) -> None:
+    export_report(tmp_path)
+
+    assert (tmp_path / "report.csv").exists()
+
+
+@pytest.mark.idempotent(watch_paths=["tmp_path"])
+def test_export_log(tmp_path: Path) -> None:
+    export_log(tmp_path)
+
+    assert (tmp_path / "export.log").exists()
+
+
+@pytest.mark.idempotent(watch_paths=["tmp_path"])
+def test_export_batch(tmp_path: Path) -> None:
+    export_batch(tmp_path)
+
+    assert (tmp_path / "batch_0.csv").exists()
+
+
+@pytest.mark.idempotent(watch_paths=["tmp_path"])
+def test_prune_oldest(tmp_path: Path) -> None:
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_text(name)
+
+    prune_oldest(tmp_path)
+
+    assert not (tmp_path / "a").exists()
+
+
+@pytest.fixture
+def export_dir(request: pytest.FixtureRequest) -> Iterator[Path]:
+    directory = request.config.rootpath / "exports"
+    directory.mkdir()
+    yield directory
+    shutil.rmtree(directory)
+
+
+@pytest.mark.idempotent(watch_paths=["exports"])
+def test_relative_watch_path(
+    export_dir: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+
+    export_log(export_dir)
+
+    assert (export_dir / "export.log").exists()
@@ -30,10 +30,58 @@ ENFORCE_TESTS_CONFTEST = """
     def pytest_idempotent_enforce_tests():
         return False
     """
+COMPARATORS_CONFTEST = """
+    pytest_plugins = ['pytest_idempotent']
+
+    def pytest_idempotent_comparators():
+        def compare_floats(run_1, run_2):
+            return None if abs(run_1 - run_2) < 1e-9 else f"{run_1} != {run_2}"
+
+        return {float: compare_floats}
+    """
+AUTO_ENFORCE_TESTS_CONFTEST = """
+    pytest_plugins = ['pytest_idempotent']
+
+    def pytest_idempotent_enforce_tests():
+        return "auto"
+    """
+PROBES_CONFTEST = """
+    from pytest_idempotent import DatabaseProbe
+
+    pytest_plugins = ['pytest_idempotent']
+
+    def pytest_idempotent_probes(item):
+        if "db" in item.funcargs:
+            return [DatabaseProbe(item.funcargs["db"], tables=["audit"])]
+        return []
+    """
 
 CONFTEST_MAP = {
     "default": DEFAULT_CONFTEST,
     "custom_decorator": CUSTOM_DECORATOR_CONFTEST,
     "random_ordering": RANDOM_ORDERING_CONFTEST,
     "enforce": ENFORCE_TESTS_CONFTEST,
+    "auto_enforce": AUTO_ENFORCE_TESTS_CONFTEST,
+    "inline": DEFAULT_CONFTEST,
+    "static_analysis": DEFAULT_CONFTEST,
+    "static_analysis_custom_decorator": CUSTOM_DECORATOR_CONFTEST,
+    "check_once_per_args": DEFAULT_CONFTEST,
+    "max_second_run_ratio": DEFAULT_CONFTEST,
+    "comparators": COMPARATORS_CONFTEST,
+    "probes": PROBES_CONFTEST,
+    "nested": DEFAULT_CONFTEST,
+    "sample_seed": DEFAULT_CONFTEST,
+    "isolation": DEFAULT_CONFTEST,
+}
+
+# Maps conftest_type -> extra command line arguments
+ARGS_MAP = {
+    "inline": ("--idempotent-inline",),
+    "static_analysis": ("--idempotent-static-analysis",),
+    "static_analysis_custom_decorator": ("--idempotent-static-analysis",),
+    "check_once_per_args": ("-o", "idempotent_check_once_per_args=true"),
+    "max_second_run_ratio": ("-o", "idempotent_max_second_run_ratio=0.5"),
+    "nested": ("-o", "idempotent_nested=all"),
+    "sample_seed": ("--idempotent-sample-seed", "3"),
+    "isolation": ("-o", "idempotent_isolation=fork"),
 }